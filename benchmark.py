@@ -0,0 +1,267 @@
+"""Offline benchmarks for the bot's handlers and notification scheduler.
+
+Drives CalendarBot handlers with synthetic updates against a fake Bot that
+records every call after an optional delay, with the Google Calendar service
+replaced by a stub, and times the scheduler's planning and sending passes over
+stores of different sizes. Needs no network access and no real token, and
+prints the results as JSON:
+
+    python3 benchmark.py --ops 2000 --api-latency 0.01
+    python3 benchmark.py --only scheduler --sizes 1000,10000,100000,1000000
+"""
+import argparse
+import asyncio
+import collections
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time as _time
+from datetime import date, datetime, timedelta
+from time import monotonic
+from types import SimpleNamespace
+
+from telegram import Update
+
+from calendar_reminder import (CalendarBot, MemoryReminderStore, NotificationScheduler, NotificationSender,
+                               ShardConfig, SQLiteReminderStore)
+from webhook_harness import make_update
+
+class FakeBot:
+    # Stands in for telegram.Bot behind the Update shortcuts (reply_text,
+    # edit_message_text, answer, ...): counts each Bot API method and waits
+    # latency seconds, like a round trip to Telegram would
+    defaults = None
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        async def call(*args, **kwargs):
+            self.calls[method] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return True
+        return call
+
+class FakeCalendarService:
+    # Answers events().list(...).execute() the way the Calendar API does, one
+    # page of at most maxResults events at a time, from a synthetic holiday list
+    def __init__(self, holidays_per_year=30, latency=0.0):
+        self.holidays_per_year = holidays_per_year
+        self.latency = latency
+        self.requests = 0
+
+    def events(self):
+        return self
+
+    def list(self, calendarId, timeMin, maxResults=250, pageToken=None, **kwargs):
+        year = int(timeMin[:4])
+        step = 365 // max(self.holidays_per_year, 1)
+        items = [
+            {'summary': f"Holiday {i + 1}", 'start': {'date': (date(year, 1, 1) + timedelta(days=i * step)).isoformat()}}
+            for i in range(self.holidays_per_year)
+        ]
+        start = int(pageToken or 0)
+        page = {'items': items[start:start + maxResults]}
+        if start + maxResults < len(items):
+            page['nextPageToken'] = str(start + maxResults)
+        return SimpleNamespace(execute=lambda: self._execute(page))
+
+    def _execute(self, page):
+        # The real client blocks its (executor) thread for the round trip
+        self.requests += 1
+        if self.latency:
+            _time.sleep(self.latency)
+        return page
+
+def summarize(name, latencies, elapsed, calls):
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+    return {
+        'name': name,
+        'ops': len(latencies),
+        'seconds': round(elapsed, 3),
+        'ops_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'api_calls': dict(calls),
+    }
+
+async def run_ops(name, ops, fake, concurrency):
+    # ops are (user_id, coroutine function) pairs; a user's ops run in order on
+    # one worker, like PerUserUpdateProcessor runs them, and users run in parallel
+    lanes = collections.defaultdict(list)
+    for user_id, op in ops:
+        lanes[user_id % concurrency].append(op)
+    latencies = []
+
+    async def lane(queued):
+        for op in queued:
+            started = monotonic()
+            await op()
+            latencies.append(monotonic() - started)
+
+    before = collections.Counter(fake.calls)
+    started = monotonic()
+    await asyncio.gather(*(lane(queued) for queued in lanes.values()))
+    elapsed = monotonic() - started
+    return summarize(name, latencies, elapsed, fake.calls - before)
+
+async def bench_handlers(args, workdir):
+    os.environ.update({
+        'BOT_TOKEN': '123456:BENCHMARK',
+        'REMINDER_STORE': args.store,
+        'REMINDER_STORE_PATH': os.path.join(workdir, 'handlers.db'),
+        'HOLIDAY_CACHE_PATH': os.path.join(workdir, 'holidays.json'),
+        'GOOGLE_DISCOVERY_CACHE_DIR': os.path.join(workdir, 'discovery'),
+    })
+    bot = CalendarBot()
+    fake = FakeBot(args.api_latency)
+    calendar = FakeCalendarService(args.holidays, args.google_latency)
+    bot.holidays._service = calendar
+    await bot.store.open()
+    await bot.holidays.open()
+
+    contexts = collections.defaultdict(lambda: SimpleNamespace(user_data={}, args=[]))
+    update_ids = iter(range(1, 10 ** 9))
+
+    def message_op(user_id, text):
+        async def op():
+            update = Update.de_json(make_update(next(update_ids), user_id, 'message', text), fake)
+            contexts[user_id].user_data['expecting_reminder'] = True
+            await bot.save_reminder(update, contexts[user_id])
+        return user_id, op
+
+    def callback_op(user_id, data):
+        async def op():
+            update = Update.de_json(make_update(next(update_ids), user_id, 'callback', data), fake)
+            await bot.handle_callback(update, contexts[user_id])
+        return user_id, op
+
+    today = date.today()
+    results = []
+    try:
+        ops = [
+            message_op(i % args.users + 1,
+                       f"Benchmark reminder {i}, {(today + timedelta(days=1 + i % 365)).isoformat()}")
+            for i in range(args.ops)
+        ]
+        results.append(await run_ops('save_reminder', ops, fake, args.concurrency))
+
+        for data in ('list_reminders', 'delete_reminder', 'list_holidays'):
+            ops = [callback_op(i % args.users + 1, data) for i in range(args.ops)]
+            results.append(await run_ops(data, ops, fake, args.concurrency))
+        results[-1]['google_requests'] = calendar.requests
+    finally:
+        await bot.store.close()
+        bot.holidays.close()
+    return results
+
+async def bench_scheduler(args, workdir, size):
+    # The passes check_notifications repeats: expire, plan the coming hours,
+    # then send what is due. All reminders fall within the next `days` days.
+    if args.store == 'sqlite':
+        store = SQLiteReminderStore(os.path.join(workdir, f"scheduler-{size}.db"))
+    else:
+        store = MemoryReminderStore()
+    await store.open()
+    fake = FakeBot(args.api_latency)
+    sender = NotificationSender(fake, concurrency=args.send_concurrency, global_rate=10 ** 9, per_chat_rate=10 ** 9)
+    scheduler = NotificationScheduler(store, sender, ShardConfig(), horizon=args.horizon * 60 * 60)
+    scheduler._wakeup = asyncio.Event()
+
+    users = max(1, size // args.reminders_per_user)
+    tomorrow = date.today() + timedelta(days=1)
+    result = {'reminders': size, 'users': users}
+    try:
+        started = monotonic()
+        for user in range(users):
+            count = size // users + (1 if user < size % users else 0)
+            await store.add_many(str(user + 1), [
+                (f"Reminder {user}-{i}", (tomorrow + timedelta(days=(user + i) % args.days)).toordinal(), -1)
+                for i in range(count)
+            ])
+        await store.flush()
+        result['load_seconds'] = round(monotonic() - started, 3)
+
+        started = monotonic()
+        await store.expire_before((date.today() - timedelta(days=2)).toordinal())
+        result['expire_seconds'] = round(monotonic() - started, 3)
+
+        now = scheduler.now()
+        started = monotonic()
+        await scheduler._plan(now, now + scheduler.horizon)
+        result['plan_seconds'] = round(monotonic() - started, 3)
+        result['planned_jobs'] = len(scheduler._heap)
+
+        started = monotonic()
+        await scheduler._fire_due(now + scheduler.horizon)
+        elapsed = monotonic() - started
+        result['fire_seconds'] = round(elapsed, 3)
+        result['messages_sent'] = fake.calls['send_message']
+        result['messages_per_second'] = round(fake.calls['send_message'] / elapsed, 1) if elapsed else None
+    finally:
+        await store.close()
+    return result
+
+async def main(args):
+    report = {
+        'config': {
+            'store': args.store,
+            'api_latency': args.api_latency,
+            'google_latency': args.google_latency,
+            'python': sys.version.split()[0],
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+        }
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.only in (None, 'handlers'):
+            report['config'].update({'ops': args.ops, 'users': args.users, 'concurrency': args.concurrency})
+            report['handlers'] = await bench_handlers(args, workdir)
+        if args.only in (None, 'scheduler'):
+            report['scheduler'] = []
+            for size in args.sizes:
+                report['scheduler'].append(await bench_scheduler(args, workdir, size))
+                gc.collect()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the bot's handlers and notification scheduler offline")
+    parser.add_argument('--only', choices=['handlers', 'scheduler'])
+    parser.add_argument('--store', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--ops', type=int, default=1000, help="updates per handler")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16, help="users handled in parallel")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="seconds the fake Bot waits per call")
+    parser.add_argument('--google-latency', type=float, default=0.0, help="seconds the stub Calendar API waits per page")
+    parser.add_argument('--holidays', type=int, default=30, help="holidays per year in the stub calendar")
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')],
+                        default=[1000, 10000, 100000, 1000000], help="comma-separated reminder counts")
+    parser.add_argument('--reminders-per-user', type=int, default=10)
+    parser.add_argument('--days', type=int, default=7, help="days the scheduler's reminders are spread over")
+    parser.add_argument('--horizon', type=float, default=48, help="hours planned and sent in one pass")
+    parser.add_argument('--send-concurrency', type=int, default=20)
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    sys.exit(asyncio.run(main(args)))
@@ -1,12 +1,36 @@
 import warnings
+import argparse
 from urllib3.exceptions import NotOpenSSLWarning
 from telegram.warnings import PTBUserWarning
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, InputFile, Update
+from telegram.error import BadRequest, NetworkError, RetryAfter
 import datetime
 import json
+import csv
+import io
+import re
+import tempfile
 import asyncio
-from datetime import datetime, timedelta, time
+import heapq
+import itertools
+import socket
+import zlib
+import collections
+import hashlib
+import hmac
+import ipaddress
+import bisect
+import functools
+import contextlib
+import random
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from datetime import date, datetime, timedelta, time, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from time import monotonic
 import os
 from dotenv import load_dotenv
 from googleapiclient.discovery import build
@@ -25,12 +49,6 @@ warnings.filterwarnings("ignore", category=PTBUserWarning)
 # States for conversation handler
 CHOOSING_ACTION, ADDING_REMINDER = range(2)
 
-def signal_handler(signum, frame):
-    logger.info("Signal received. Performing cleanup...")
-    sys.exit(0)
-
-signal.signal(signal.SIGTERM, signal_handler)
-
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -40,28 +58,1093 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class MemoryCache(Cache):
-    _CACHE = {}
+# Passed as extra= on log records written for every update; see SampledLogFilter
+PER_REQUEST = {'per_request': True}
+
+class SampledLogFilter(logging.Filter):
+    # Keeps only a fraction of the per-request records, so INFO logging stays
+    # affordable under load; every other record passes
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return not getattr(record, 'per_request', False) or random.random() < self.rate
+
+class Metrics:
+    # Counters, gauges and histograms kept in memory and rendered in the Prometheus
+    # text format. A series is a metric name plus a sorted tuple of label pairs.
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self._descriptions = {}  # name -> (type, help text)
+        self._values = collections.defaultdict(float)  # (name, labels) -> counter or gauge value
+        self._histograms = {}  # (name, labels) -> [count per bucket..., count above the last, sum, count]
+
+    def describe(self, name, kind, text):
+        self._descriptions[name] = (kind, text)
+
+    def inc(self, name, amount=1, **labels):
+        self._values[(name, tuple(sorted(labels.items())))] += amount
+
+    def set(self, name, value, **labels):
+        self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = [0] * (len(self.buckets) + 3)
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, monotonic() - started, **labels)
+
+    async def watch_event_loop(self, interval=0.5):
+        # How late the loop wakes a sleeping task is how long callbacks wait to run
+        while True:
+            started = monotonic()
+            await asyncio.sleep(interval)
+            lag = max(monotonic() - started - interval, 0)
+            self.observe('bot_event_loop_lag_seconds', lag)
+            self.set('bot_event_loop_lag_last_seconds', lag)
+
+    def render(self):
+        series = collections.defaultdict(list)
+        for (name, labels), value in self._values.items():
+            series[name].append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), histogram in self._histograms.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                cumulative += count
+                series[name].append(f"{name}_bucket{self._labels(labels + (('le', str(bound)),))} {cumulative}")
+            series[name].append(f"{name}_sum{self._labels(labels)} {histogram[-2]:g}")
+            series[name].append(f"{name}_count{self._labels(labels)} {histogram[-1]}")
+
+        lines = []
+        for name in sorted(series):
+            if name in self._descriptions:
+                kind, text = self._descriptions[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.extend(series[name])
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ''
+        escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+metrics = Metrics()
+metrics.describe('bot_handler_seconds', 'histogram', "Time spent handling an update, by handler")
+metrics.describe('bot_google_api_seconds', 'histogram', "Latency of Google Calendar API calls")
+metrics.describe('bot_google_api_errors_total', 'counter', "Google Calendar API calls that failed")
+metrics.describe('bot_cache_requests_total', 'counter', "Cache lookups by cache and result")
+metrics.describe('bot_telegram_send_seconds', 'histogram', "Latency of notification sendMessage calls")
+metrics.describe('bot_notifications_sent_total', 'counter', "Notifications delivered")
+metrics.describe('bot_notifications_failed_total', 'counter', "Notifications given up on")
+metrics.describe('bot_notification_retries_total', 'counter', "Notification send retries by reason")
+metrics.describe('bot_event_loop_lag_seconds', 'histogram', "How late the event loop ran a timer")
+metrics.describe('bot_event_loop_lag_last_seconds', 'gauge', "Event loop lag at the last check")
+
+def replace_file(path, content):
+    # Writes content to a temp file of its own next to path and renames it over path.
+    # Shard workers share cache files, so a fixed temp name could be truncated by
+    # one writer while another is about to rename it into place.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.',
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+class FileDiscoveryCache(Cache):
+    # Discovery documents kept on disk so a restarted worker skips the discovery
+    # request. Entries expire after ttl seconds and only the newest max_entries are kept.
+    def __init__(self, directory='.discovery_cache', ttl=7 * 24 * 60 * 60, max_entries=16):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
 
     def get(self, url):
-        return MemoryCache._CACHE.get(url)
+        path = self._path(url)
+        try:
+            if datetime.now().timestamp() - os.path.getmtime(path) > self.ttl:
+                metrics.inc('bot_cache_requests_total', cache='discovery', result='miss')
+                return None
+            with open(path, encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            metrics.inc('bot_cache_requests_total', cache='discovery', result='miss')
+            return None
+        metrics.inc('bot_cache_requests_total', cache='discovery', result='hit')
+        return content
 
     def set(self, url, content):
-        MemoryCache._CACHE[url] = content
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            replace_file(self._path(url), content)
+            self._evict()
+        except OSError as e:
+            logger.error(f"Error writing discovery cache: {str(e)}")
 
-class CalendarBot:
+    def _evict(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.json')]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.max_entries:]:
+            os.remove(path)
+
+class RenderCache:
+    # Rendered messages keyed by everything they were rendered from, so an entry
+    # never needs invalidating: a change produces a new key and the old entry ages
+    # out. The least recently used entries are dropped beyond max_entries.
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        metrics.inc('bot_cache_requests_total', cache=f"render_{key[0]}", result='miss' if value is None else 'hit')
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class Reminder:
+    # One reminder, kept small: the date is a proleptic Gregorian ordinal and the
+    # time of day is minutes after midnight, or -1 for an all-day reminder.
+    # Reminders order by (date, time, id), so a user's list stays sorted with bisect.
+    __slots__ = ('id', 'ordinal', 'minute', 'description')
+
+    def __init__(self, reminder_id, ordinal, minute, description):
+        self.id = reminder_id
+        self.ordinal = ordinal
+        self.minute = minute
+        self.description = description
+
+    def __lt__(self, other):
+        return (self.ordinal, self.minute, self.id) < (other.ordinal, other.minute, other.id)
+
+    @staticmethod
+    def probe(ordinal):
+        # Sorts before every reminder dated ordinal or later
+        return Reminder(0, ordinal, -1, '')
+
+    @property
+    def date_str(self):
+        return date.fromordinal(self.ordinal).isoformat()
+
+    @property
+    def time_str(self):
+        if self.minute < 0:
+            return None
+        return f"{self.minute // 60:02d}:{self.minute % 60:02d}"
+
+    @classmethod
+    def from_strings(cls, reminder_id, description, date_str, time_str=None):
+        minute = -1
+        if time_str:
+            hours, minutes = map(int, time_str.split(':'))
+            minute = hours * 60 + minutes
+        return cls(reminder_id, date.fromisoformat(date_str).toordinal(), minute, description)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls.from_strings(data['id'], data['description'], data['date'], data.get('time'))
+
+    def to_dict(self):
+        return {'id': self.id, 'description': self.description, 'date': self.date_str, 'time': self.time_str}
+
+class DueDateIndex:
+    # Reminders bucketed by date ordinal so the notifier only touches what is due
     def __init__(self):
-        load_dotenv()
-        self.token = os.getenv('BOT_TOKEN')
-        if not self.token:
-            raise ValueError("No token provided")
-        self.application = None
-        self.holiday_cache = None
-        self.cache_expiry = 24 * 60 * 60  # 24 hours in seconds
-        self.reminders = {}  # Initialize as an empty dictionary
-        logger.info("Bot initialized")
+        self._buckets = {}  # ordinal -> {reminder_id: (user_id, reminder)}
+        self._dates = []  # min-heap of bucket ordinals, may hold ordinals of emptied buckets
+
+    def add(self, user_id, reminder):
+        bucket = self._buckets.get(reminder.ordinal)
+        if bucket is None:
+            bucket = self._buckets[reminder.ordinal] = {}
+            heapq.heappush(self._dates, reminder.ordinal)
+        bucket[reminder.id] = (user_id, reminder)
+
+    def remove(self, reminder):
+        bucket = self._buckets.get(reminder.ordinal)
+        if bucket is not None:
+            bucket.pop(reminder.id, None)
+            if not bucket:
+                del self._buckets[reminder.ordinal]
+
+    def due_on(self, ordinal):
+        return list(self._buckets.get(ordinal, {}).values())
+
+    def pop_expired(self, ordinal):
+        expired = []
+        while self._dates and self._dates[0] < ordinal:
+            bucket = self._buckets.pop(heapq.heappop(self._dates), None)
+            if bucket:
+                expired.extend(bucket.values())
+        return expired
+
+class ReminderStore(ABC):
+    # Base class for reminder persistence backends. Changes are applied in memory
+    # immediately and written to disk by a background task that group-commits
+    # everything queued within commit_interval, so handlers never wait on fsync.
+    durable = False
+    # Errors a batch is retried after; anything else means some record in it can never be written
+    transient_errors = (OSError, sqlite3.OperationalError)
+
+    def __init__(self, commit_interval=0.05):
+        self.commit_interval = commit_interval
+        self._pending = []
+        self._flush_task = None
+        self._flush_lock = None
+        self._executor = ThreadPoolExecutor(max_workers=1)  # all disk I/O happens on this thread
+        self._next_id = 1
+        self._versions = {}  # user_id -> number of changes to the user's reminders
+
+    async def open(self):
+        self._flush_lock = asyncio.Lock()
+
+    async def close(self):
+        await self.flush()
+        if self._flush_task:
+            self._flush_task.cancel()
+        await self._run_io(self._close)
+        self._executor.shutdown(wait=True)
+
+    def _close(self):
+        pass
+
+    @abstractmethod
+    async def get_user(self, user_id):
+        # The user's reminders as a list sorted by (date, time, id)
+        raise NotImplementedError
+
+    async def page(self, user_id, after, limit):
+        # Up to limit reminders sorting after the cursor reminder, and whether more follow
+        reminders = await self.get_user(user_id)
+        start = bisect.bisect_right(reminders, after)
+        return reminders[start:start + limit], start + limit < len(reminders)
+
+    async def existing(self, pairs):
+        # The IDs among the (user_id, reminder_id) pairs that are still stored
+        wanted = {}
+        for user_id, reminder_id in pairs:
+            wanted.setdefault(user_id, set()).add(reminder_id)
+        found = set()
+        for user_id, reminder_ids in wanted.items():
+            found.update(r.id for r in await self.get_user(user_id) if r.id in reminder_ids)
+        return found
+
+    @abstractmethod
+    async def user_ids(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add(self, user_id, description, ordinal, minute=-1):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_many(self, user_id, entries):
+        # Adds (description, ordinal, minute) entries with a single sort and a single
+        # queued record; returns the new reminders
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove(self, user_id, reminder_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def due_on(self, ordinal):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def expire_before(self, ordinal):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_timezones(self, user_ids):
+        # {user_id: timezone name or None}
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_timezone(self, user_id, timezone_name):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_meta(self, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_meta(self, key, value):
+        # Durable by the time this returns
+        raise NotImplementedError
+
+    def version(self, user_id):
+        # Changes whenever the user's reminders do, so callers can cache what they render from them
+        return self._versions.get(user_id, 0)
+
+    def _touch(self, user_id):
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def _new_id(self):
+        reminder_id = self._next_id
+        self._next_id += 1
+        return reminder_id
+
+    def _advance_ids(self, used_id):
+        self._next_id = max(self._next_id, used_id + 1)
+
+    async def _run_io(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _enqueue(self, op):
+        if not self.durable:
+            return
+        self._pending.append(op)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        delay = self.commit_interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error committing reminder batch, will retry: {str(e)}")
+                delay = 1
+                continue
+            if not self._pending:
+                break
+
+    async def flush(self):
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            write = self._prepare_write(batch)
+            try:
+                await self._run_io(write)
+            except self.transient_errors:
+                self._pending[:0] = batch  # Keep the batch for the next attempt
+                raise
+            except Exception:
+                await self._write_each(batch)
+
+    async def _write_each(self, batch):
+        # The batch holds a record that fails every time: write the records one by
+        # one and drop the ones that fail, so the rest of the batch and everything
+        # queued after it still reach disk
+        for position, record in enumerate(batch):
+            try:
+                await self._run_io(self._prepare_write([record]))
+            except self.transient_errors:
+                self._pending[:0] = batch[position:]
+                raise
+            except Exception as e:
+                logger.error(f"Dropping reminder record that can't be written ({record['op']}): {str(e)}")
+
+    def _prepare_write(self, batch):
+        # Runs on the event loop; returns the callable executed on the I/O thread
+        return functools.partial(self._write_batch, batch)
+
+    @abstractmethod
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+class MemoryReminderStore(ReminderStore):
+    # Keeps everything in memory; also the in-memory half of LogReminderStore
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._users = {}
+        self._index = DueDateIndex()
+        self._timezones = {}
+        self._meta = {}
+
+    async def get_user(self, user_id):
+        return self._users.get(user_id, [])
+
+    async def user_ids(self):
+        return list(self._users)
+
+    async def add(self, user_id, description, ordinal, minute=-1):
+        reminder = Reminder(self._new_id(), ordinal, minute, description)
+        self._apply_add(user_id, reminder)
+        self._enqueue({'op': 'add', 'user_id': user_id, 'reminder': reminder.to_dict()})
+        return reminder
+
+    async def add_many(self, user_id, entries):
+        reminders = [Reminder(self._new_id(), ordinal, minute, description) for description, ordinal, minute in entries]
+        if reminders:
+            self._apply_add_many(user_id, reminders)
+            self._enqueue({'op': 'add_many', 'user_id': user_id, 'reminders': [r.to_dict() for r in reminders]})
+        return reminders
+
+    async def remove(self, user_id, reminder_ids):
+        reminder_ids = list(reminder_ids)
+        removed = self._apply_remove(user_id, reminder_ids)
+        if removed:
+            self._enqueue({'op': 'remove', 'user_id': user_id, 'ids': [r.id for r in removed]})
+        return removed
+
+    async def due_on(self, ordinal):
+        return self._index.due_on(ordinal)
+
+    async def expire_before(self, ordinal):
+        expired = self._apply_expire(ordinal)
+        if expired:
+            self._enqueue({'op': 'expire', 'before': date.fromordinal(ordinal).isoformat()})
+        return expired
+
+    async def get_timezones(self, user_ids):
+        return {user_id: self._timezones.get(user_id) for user_id in user_ids}
+
+    async def set_timezone(self, user_id, timezone_name):
+        self._users.setdefault(user_id, [])
+        self._timezones[user_id] = timezone_name
+        self._enqueue({'op': 'timezone', 'user_id': user_id, 'timezone': timezone_name})
+
+    async def get_meta(self, key):
+        return self._meta.get(key)
+
+    async def set_meta(self, key, value):
+        self._meta[key] = value
+        self._enqueue({'op': 'meta', 'key': key, 'value': value})
+        await self.flush()
+
+    def _write_batch(self, batch):
+        pass  # Nothing is queued unless durable, and LogReminderStore writes its own
+
+    def _apply_add(self, user_id, reminder):
+        bisect.insort(self._users.setdefault(user_id, []), reminder)
+        self._index.add(user_id, reminder)
+        self._advance_ids(reminder.id)
+        self._touch(user_id)
+
+    def _apply_add_many(self, user_id, reminders):
+        # Appending and sorting once beats an insort per reminder
+        user_reminders = self._users.setdefault(user_id, [])
+        user_reminders.extend(reminders)
+        user_reminders.sort()
+        for reminder in reminders:
+            self._index.add(user_id, reminder)
+        self._advance_ids(max(reminder.id for reminder in reminders))
+        self._touch(user_id)
+
+    def _apply_remove(self, user_id, reminder_ids):
+        reminder_ids = set(reminder_ids)
+        kept, removed = [], []
+        for reminder in self._users.get(user_id, []):
+            (removed if reminder.id in reminder_ids else kept).append(reminder)
+        for reminder in removed:
+            self._index.remove(reminder)
+        if removed:
+            self._users[user_id] = kept
+            self._touch(user_id)
+        return removed
+
+    def _apply_expire(self, ordinal):
+        # Drop reminders dated before ordinal; lists are sorted, so each affected
+        # user loses a prefix
+        expired_users = collections.Counter()
+        for user_id, reminder in self._index.pop_expired(ordinal):
+            expired_users[user_id] += 1
+
+        for user_id in expired_users:
+            reminders = self._users.get(user_id, [])
+            del reminders[:bisect.bisect_left(reminders, Reminder.probe(ordinal))]
+            self._touch(user_id)
+        return sum(expired_users.values())
+
+class LogReminderStore(MemoryReminderStore):
+    # Append-only JSON-lines log of changes plus a periodic snapshot. Every record
+    # carries a sequence number and the snapshot remembers the last one it covers,
+    # so a crash between writing the snapshot and truncating the log replays cleanly,
+    # and a record written twice by a retried batch is applied once. A record torn by
+    # a crash is cut off on open, so later appends don't end up behind it.
+    # The whole store is replayed into memory on open.
+    durable = True
+
+    def __init__(self, path, compact_every=10000, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.compact_every = compact_every
+        self._seq = 0
+        self._log = None
+        self._log_entries = 0
+
+    async def open(self):
+        await super().open()
+        await self._run_io(self._replay)
+        logger.info(f"Loaded {sum(len(r) for r in self._users.values())} reminders from {self.path}")
+
+    def _replay(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            for user_id, reminders in snapshot['users'].items():
+                self._users.setdefault(user_id, [])
+                for reminder in reminders:
+                    self._apply_add(user_id, Reminder.from_dict(reminder))
+            self._timezones = snapshot.get('timezones', {})
+            self._meta = snapshot.get('meta', {})
+            # Deleted and expired reminders are gone from the snapshot, but their IDs stay used
+            self._advance_ids(snapshot.get('next_id', 1) - 1)
+            self._seq = snapshot['seq']
+
+        if os.path.exists(self.path):
+            intact = 0  # Offset just past the last complete record
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("record is missing its newline")
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    intact += len(line)
+                    self._log_entries += 1
+                    if record['seq'] <= self._seq:
+                        continue  # Covered by the snapshot, or a retried batch wrote it twice
+                    self._apply_record(record)
+                    self._seq = record['seq']
+            if intact < os.path.getsize(self.path):
+                logger.warning(f"Cutting torn record off the end of {self.path} at offset {intact}")
+                os.truncate(self.path, intact)
+
+        self._log = open(self.path, 'ab', buffering=0)
+
+    def _apply_record(self, record):
+        if record['op'] == 'add':
+            self._apply_add(record['user_id'], Reminder.from_dict(record['reminder']))
+        elif record['op'] == 'add_many':
+            self._apply_add_many(record['user_id'], [Reminder.from_dict(r) for r in record['reminders']])
+        elif record['op'] == 'remove':
+            self._apply_remove(record['user_id'], record['ids'])
+        elif record['op'] == 'expire':
+            self._apply_expire(date.fromisoformat(record['before']).toordinal())
+        elif record['op'] == 'timezone':
+            self._users.setdefault(record['user_id'], [])
+            self._timezones[record['user_id']] = record['timezone']
+        elif record['op'] == 'meta':
+            self._meta[record['key']] = record['value']
+
+    def _enqueue(self, op):
+        self._seq += 1
+        op['seq'] = self._seq
+        super()._enqueue(op)
+
+    def _prepare_write(self, batch):
+        if self._log_entries + len(batch) < self.compact_every:
+            return functools.partial(self._write_batch, batch)
+        # Memory already reflects every queued record, so the snapshot replaces them all
+        snapshot = {
+            'seq': self._seq,
+            'next_id': self._next_id,
+            'users': {user_id: [r.to_dict() for r in reminders] for user_id, reminders in self._users.items()},
+            'timezones': dict(self._timezones),
+            'meta': dict(self._meta)
+        }
+        return functools.partial(self._write_snapshot, snapshot)
+
+    def _write_batch(self, batch):
+        data = memoryview(''.join(json.dumps(record) + '\n' for record in batch).encode('utf-8'))
+        start = self._log.seek(0, os.SEEK_END)
+        try:
+            while data:
+                data = data[self._log.write(data):]
+            os.fsync(self._log.fileno())
+        except OSError:
+            # Cut off the part that made it, so the retried batch doesn't land behind a torn record
+            with contextlib.suppress(OSError):
+                self._log.truncate(start)
+            raise
+        self._log_entries += len(batch)
+
+    def _write_snapshot(self, snapshot):
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._log.close()
+        self._log = open(self.path, 'wb', buffering=0)
+        self._log_entries = 0
+        logger.info(f"Compacted reminder log into {self.snapshot_path}")
+
+    def _close(self):
+        if self._log:
+            self._log.close()
+
+class SQLiteReminderStore(ReminderStore):
+    # Reminders live in SQLite (WAL mode); a user's reminders are read into memory
+    # the first time that user is seen, and due/expiry queries go through the date index.
+    # Dates stay 'YYYY-MM-DD' text on disk and become Reminder ordinals on load.
+    durable = True
+    id_block = 100  # Reminder IDs reserved from the database at a time
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._conn = None
+        self._id_limit = 0  # End of the reserved block _next_id is handed out from
+        self._users = {}  # user_id -> reminders, for users loaded so far
+        self._timezones = {}  # user_id -> timezone name, for users looked up so far
+        # Held while a user is read from disk and while rows of a user not loaded yet
+        # are deleted, so a load never caches rows whose delete is being queued
+        self._load_lock = None
+
+    async def open(self):
+        await super().open()
+        self._load_lock = asyncio.Lock()
+        await self._run_io(self._connect)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS reminders ('
+                'id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, description TEXT NOT NULL, date TEXT NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_reminders_user ON reminders (user_id)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_reminders_date ON reminders (date)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            # Columns added after the first release
+            self._add_column('reminders', 'time', 'TEXT')
+            self._add_column('users', 'timezone', 'TEXT')
+            # Serves page() for users not loaded into memory
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_reminders_user_order ON reminders (user_id, date, IFNULL(time, ''), id)"
+            )
+            # Databases from before the counter start it after the highest ID in use
+            self._conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) "
+                "SELECT 'next_reminder_id', IFNULL(MAX(id), 0) + 1 FROM reminders"
+            )
+
+    def _reserve_ids(self, count):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE meta SET value = CAST(value AS INTEGER) + ? WHERE key = 'next_reminder_id'", (count,)
+            )
+            end = self._conn.execute("SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'next_reminder_id'").fetchone()[0]
+        return end - count
+
+    async def _take_ids(self, count):
+        # IDs come from a counter in the database, reserved a block at a time in a
+        # write transaction. Processes sharing the file (other shards, or an old and
+        # a new deployment of the same shard) never hand out the same ID, and the ID
+        # of a deleted or expired reminder is never handed out again.
+        if self._id_limit - self._next_id < count:
+            size = max(count, self.id_block)
+            start = await self._run_io(self._reserve_ids, size)
+            self._next_id, self._id_limit = start, start + size
+        first = self._next_id
+        self._next_id += count
+        return range(first, first + count)
+
+    def _add_column(self, table, column, column_type):
+        columns = [row[1] for row in self._conn.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    def _close(self):
+        if self._conn:
+            self._conn.close()
+
+    def _query(self, sql, params=()):
+        return self._conn.execute(sql, params).fetchall()
+
+    async def get_user(self, user_id):
+        if user_id not in self._users:
+            async with self._load_lock:
+                if user_id not in self._users:
+                    await self.flush()  # remove() can queue deletes for users not loaded yet
+                    rows = await self._run_io(
+                        self._query,
+                        'SELECT id, description, date, time FROM reminders WHERE user_id = ? ORDER BY date, time, id',
+                        (user_id,)
+                    )
+                    self._users[user_id] = [Reminder.from_strings(*row) for row in rows]
+        return self._users[user_id]
+
+    async def user_ids(self):
+        await self.flush()
+        rows = await self._run_io(self._query, 'SELECT user_id FROM users')
+        return [row[0] for row in rows]
+
+    async def add(self, user_id, description, ordinal, minute=-1):
+        reminders = await self.get_user(user_id)
+        reminder = Reminder((await self._take_ids(1))[0], ordinal, minute, description)
+        bisect.insort(reminders, reminder)
+        self._touch(user_id)
+        self._enqueue({'op': 'add', 'user_id': user_id, 'reminder': reminder})
+        return reminder
+
+    async def add_many(self, user_id, entries):
+        user_reminders = await self.get_user(user_id)
+        entries = list(entries)
+        ids = await self._take_ids(len(entries))
+        reminders = [Reminder(reminder_id, ordinal, minute, description)
+                     for reminder_id, (description, ordinal, minute) in zip(ids, entries)]
+        if reminders:
+            user_reminders.extend(reminders)
+            user_reminders.sort()
+            self._touch(user_id)
+            self._enqueue({'op': 'add_many', 'user_id': user_id, 'reminders': reminders})
+        return reminders
+
+    async def remove(self, user_id, reminder_ids):
+        reminder_ids = set(reminder_ids)
+        if user_id in self._users:
+            return self._remove_loaded(user_id, reminder_ids)
+        async with self._load_lock:
+            if user_id in self._users:
+                return self._remove_loaded(user_id, reminder_ids)
+            # Don't load the whole user just to delete a few rows
+            await self.flush()
+            ids = list(reminder_ids)
+            rows = await self._run_io(
+                self._query,
+                f"SELECT id, description, date, time FROM reminders WHERE user_id = ? AND id IN ({','.join('?' * len(ids))})",
+                [user_id] + ids
+            )
+            removed = [Reminder.from_strings(*row) for row in rows]
+            if removed:
+                self._touch(user_id)
+                self._enqueue({'op': 'remove', 'user_id': user_id, 'ids': [r.id for r in removed]})
+        return removed
+
+    def _remove_loaded(self, user_id, reminder_ids):
+        reminders = self._users[user_id]
+        removed = [r for r in reminders if r.id in reminder_ids]
+        if removed:
+            self._users[user_id] = [r for r in reminders if r.id not in reminder_ids]
+            self._touch(user_id)
+            self._enqueue({'op': 'remove', 'user_id': user_id, 'ids': [r.id for r in removed]})
+        return removed
+
+    async def page(self, user_id, after, limit):
+        if user_id in self._users:
+            return await super().page(user_id, after, limit)
+        await self.flush()
+        rows = await self._run_io(
+            self._query,
+            "SELECT id, description, date, time FROM reminders "
+            "WHERE user_id = ? AND (date, IFNULL(time, ''), id) > (?, ?, ?) "
+            "ORDER BY date, IFNULL(time, ''), id LIMIT ?",
+            (user_id, after.date_str, after.time_str or '', after.id, limit + 1)
+        )
+        return [Reminder.from_strings(*row) for row in rows[:limit]], len(rows) > limit
+
+    async def existing(self, pairs):
+        # Reminder IDs are unique across users, so this checks rows without loading anyone
+        ids = list({reminder_id for _, reminder_id in pairs})
+        found = set()
+        if ids:
+            await self.flush()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = await self._run_io(
+                self._query, f"SELECT id FROM reminders WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update(row[0] for row in rows)
+        return found
+
+    async def due_on(self, ordinal):
+        await self.flush()
+        rows = await self._run_io(
+            self._query, 'SELECT user_id, id, description, date, time FROM reminders WHERE date = ?',
+            (date.fromordinal(ordinal).isoformat(),)
+        )
+        return [(row[0], Reminder.from_strings(*row[1:])) for row in rows]
+
+    async def expire_before(self, ordinal):
+        await self.flush()
+        user_ids, expired = await self._run_io(self._expire, date.fromordinal(ordinal).isoformat())
+        for user_id in user_ids:
+            self._touch(user_id)
+            reminders = self._users.get(user_id)
+            if reminders:
+                del reminders[:bisect.bisect_left(reminders, Reminder.probe(ordinal))]
+        return expired
+
+    def _expire(self, date_str):
+        user_ids = [row[0] for row in self._query('SELECT DISTINCT user_id FROM reminders WHERE date < ?', (date_str,))]
+        with self._conn:
+            expired = self._conn.execute('DELETE FROM reminders WHERE date < ?', (date_str,)).rowcount
+        return user_ids, expired
+
+    async def get_timezones(self, user_ids):
+        missing = [user_id for user_id in user_ids if user_id not in self._timezones]
+        if missing:
+            await self.flush()
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = await self._run_io(
+                    self._query,
+                    f"SELECT user_id, timezone FROM users WHERE user_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                found = dict(rows)
+                for user_id in chunk:
+                    self._timezones.setdefault(user_id, found.get(user_id))
+        return {user_id: self._timezones[user_id] for user_id in user_ids}
+
+    async def set_timezone(self, user_id, timezone_name):
+        self._timezones[user_id] = timezone_name
+        self._enqueue({'op': 'timezone', 'user_id': user_id, 'timezone': timezone_name})
+
+    async def get_meta(self, key):
+        await self.flush()
+        rows = await self._run_io(self._query, 'SELECT value FROM meta WHERE key = ?', (key,))
+        return rows[0][0] if rows else None
+
+    async def set_meta(self, key, value):
+        self._enqueue({'op': 'meta', 'key': key, 'value': value})
+        await self.flush()
+
+    def _write_batch(self, batch):
+        # One transaction, and so one fsync, per batch
+        with self._conn:
+            for record in batch:
+                if record['op'] == 'add':
+                    reminder = record['reminder']
+                    self._conn.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (record['user_id'],))
+                    self._conn.execute(
+                        'INSERT INTO reminders (id, user_id, description, date, time) VALUES (?, ?, ?, ?, ?)',
+                        (reminder.id, record['user_id'], reminder.description, reminder.date_str, reminder.time_str)
+                    )
+                elif record['op'] == 'add_many':
+                    self._conn.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (record['user_id'],))
+                    self._conn.executemany(
+                        'INSERT INTO reminders (id, user_id, description, date, time) VALUES (?, ?, ?, ?, ?)',
+                        [(r.id, record['user_id'], r.description, r.date_str, r.time_str) for r in record['reminders']]
+                    )
+                elif record['op'] == 'remove':
+                    self._conn.executemany(
+                        'DELETE FROM reminders WHERE user_id = ? AND id = ?',
+                        [(record['user_id'], reminder_id) for reminder_id in record['ids']]
+                    )
+                elif record['op'] == 'timezone':
+                    self._conn.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (record['user_id'],))
+                    self._conn.execute('UPDATE users SET timezone = ? WHERE user_id = ?',
+                                       (record['timezone'], record['user_id']))
+                elif record['op'] == 'meta':
+                    self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                       (record['key'], record['value']))
+
+def create_reminder_store(shard=None):
+    backend = os.getenv('REMINDER_STORE', 'sqlite')
+    if backend == 'sqlite':
+        store = SQLiteReminderStore(os.getenv('REMINDER_STORE_PATH', 'reminders.db'))
+    elif backend == 'log':
+        store = LogReminderStore(os.getenv('REMINDER_STORE_PATH', 'reminders.log'))
+    elif backend == 'memory':
+        store = MemoryReminderStore()
+    else:
+        raise ValueError(f"Unknown REMINDER_STORE backend: {backend}")
+
+    if shard and shard.count > 1 and backend != 'sqlite':
+        raise ValueError("Sharded workers need the shared sqlite reminder store")
+    return store
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = monotonic()
+
+    async def acquire(self):
+        while True:
+            now = monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class NotificationSender:
+    # Fans messages out over a fixed pool of workers, staying under Telegram's global
+    # and per-chat limits. RetryAfter pauses every worker for the requested time;
+    # network errors are retried with exponential backoff.
+    def __init__(self, bot, concurrency=20, global_rate=30, per_chat_rate=1, max_retries=3):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}
+        self._paused_until = 0
+        self._stopping = False
+
+    def stop(self):
+        # Workers finish the sends in flight and take no new ones
+        self._stopping = True
+
+    async def send_all(self, messages, label='messages', on_result=None):
+        # on_result(position) is called as soon as the message at that position has
+        # been sent or given up on
+        messages = enumerate(messages)
+        report = {'sent': 0, 'failed': 0, 'retried': 0}
+        started = monotonic()
+
+        async def worker():
+            for position, (chat_id, text) in messages:
+                if self._stopping:
+                    break
+                if await self._send_with_retry(chat_id, text, report):
+                    report['sent'] += 1
+                else:
+                    report['failed'] += 1
+                if on_result:
+                    on_result(position)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        self._chat_buckets.clear()
+
+        report['seconds'] = monotonic() - started
+        total = report['sent'] + report['failed']
+        if total > 1:
+            logger.info(
+                f"Sent {report['sent']}/{total} {label} in {report['seconds']:.1f}s "
+                f"({report['sent'] / max(report['seconds'], 0.001):.1f} msg/s), "
+                f"{report['failed']} failed, {report['retried']} retries"
+            )
+        return report
+
+    async def _acquire(self, chat_id):
+        delay = self._paused_until - monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1)
+        await bucket.acquire()
+        await self._global_bucket.acquire()
+
+    async def _send_with_retry(self, chat_id, text, report):
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id)
+            try:
+                with metrics.timer('bot_telegram_send_seconds'):
+                    await self.bot.send_message(chat_id=chat_id, text=text)
+                metrics.inc('bot_notifications_sent_total')
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning(f"Flood control hit, pausing sends for {retry_after}s")
+                self._paused_until = max(self._paused_until, monotonic() + retry_after)
+                reason = 'flood_control'
+            except BadRequest as e:
+                # Subclasses NetworkError, but the same request fails the same way again
+                logger.error(f"Failed to send message to user {chat_id}: {str(e)}")
+                metrics.inc('bot_notifications_failed_total')
+                return False
+            except NetworkError as e:
+                logger.warning(f"Network error sending to user {chat_id}: {str(e)}")
+                reason = 'network'
+            except Exception as e:
+                logger.error(f"Failed to send message to user {chat_id}: {str(e)}")
+                metrics.inc('bot_notifications_failed_total')
+                return False
+            if attempt == self.max_retries:
+                break  # No retry follows, so don't count or back off for one
+            metrics.inc('bot_notification_retries_total', reason=reason)
+            report['retried'] += 1
+            if reason == 'network':
+                await asyncio.sleep(2 ** attempt)
+        logger.error(f"Giving up on message to user {chat_id} after {self.max_retries} retries")
+        metrics.inc('bot_notifications_failed_total')
+        return False
+
+DEFAULT_HOLIDAY_CALENDAR = 'en.kh#holiday@group.v.calendar.google.com'  # ID for Cambodian holidays
+
+class HolidayProvider:
+    # Holidays from Google Calendar, cached per (calendar, year) in memory and on disk.
+    # Callers are always answered from the cache; entries older than cache_expiry are
+    # refreshed in the background (stale-while-revalidate) and only a year that has
+    # never been fetched is awaited. The service (and with it the HTTP connection) is
+    # built once and every API call runs on a single worker thread, since httplib2
+    # connections are not thread-safe. Concurrent fetches of one entry share one call,
+    # and an entry whose fetch failed isn't fetched again for retry_interval.
+    def __init__(self, calendar_ids=None, cache_path='holidays.json', cache_expiry=24 * 60 * 60,
+                 discovery='static', discovery_cache=None, retry_interval=5 * 60):
+        self.calendar_ids = calendar_ids or [DEFAULT_HOLIDAY_CALENDAR]
+        self.cache_path = cache_path
+        # 'static' uses the discovery document bundled with googleapiclient (no network),
+        # 'cached' fetches it once and keeps it in discovery_cache
+        self.discovery = discovery
+        self.discovery_cache = discovery_cache or FileDiscoveryCache()
+        self.cache_expiry = cache_expiry  # 24 hours in seconds
+        self.retry_interval = retry_interval
+        self._entries = {}  # (calendar_id, year) -> {'fetched_at': timestamp, 'holidays': [...]}
+        self._merged = {}  # year -> (dates, holidays) across all calendars, sorted by date
+        self._service = None
+        self._inflight = {}  # (calendar_id, year) -> refresh task
+        self._failed_at = {}  # (calendar_id, year) -> time of the last failed fetch
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.version = 0  # Bumped whenever fetched holidays replace cached ones
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._load)
+        # Build the service in the background so the first fetch doesn't pay for it
+        loop.run_in_executor(self._executor, self.get_google_calendar_service)
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                data = json.load(f)
+            for key, entry in data.items():
+                calendar_id, year = key.rsplit('|', 1)
+                self._entries[(calendar_id, int(year))] = entry
+            logger.info(f"Loaded {len(self._entries)} cached holiday calendars from {self.cache_path}")
+        except Exception as e:
+            logger.error(f"Error loading holiday cache: {str(e)}")
+
+    def _save(self, data):
+        replace_file(self.cache_path, json.dumps(data))
 
     def get_google_calendar_service(self):
+        if self._service is not None:
+            return self._service
         try:
             creds = None
             if os.environ.get('GOOGLE_CREDENTIALS'):
@@ -72,8 +1155,13 @@ class CalendarBot:
                 logger.error("GOOGLE_CREDENTIALS environment variable not found")
                 return None
 
-            logger.info("Building Google Calendar service")
-            return build('calendar', 'v3', credentials=creds, cache=MemoryCache())
+            logger.info(f"Building Google Calendar service ({self.discovery} discovery)")
+            if self.discovery == 'static':
+                self._service = build('calendar', 'v3', credentials=creds, static_discovery=True)
+            else:
+                self._service = build('calendar', 'v3', credentials=creds, static_discovery=False,
+                                      cache=self.discovery_cache)
+            return self._service
         except json.JSONDecodeError:
             logger.error("Failed to parse GOOGLE_CREDENTIALS as JSON")
         except Exception as e:
@@ -81,55 +1169,988 @@ class CalendarBot:
         
         return None
 
-    def fetch_holidays(self):
-        current_time = datetime.now()
-        if self.holiday_cache and current_time - self.holiday_cache['timestamp'] < timedelta(seconds=self.cache_expiry):
-            logger.info("Using cached holiday data")
-            holidays = self.holiday_cache['data']
-        else:
-            logger.info("Fetching new holiday data from Google Calendar API")
-            service = self.get_google_calendar_service()
-            if service is None:
-                logger.error("Failed to get Google Calendar service")
-                return []  # Return an empty list if the service is not available
-            try:
-                calendar_id = 'en.kh#holiday@group.v.calendar.google.com'  # ID for Cambodian holidays
-                
-                # Set time range for the current year
-                year_start = datetime(current_time.year, 1, 1).isoformat() + 'Z'
-                year_end = datetime(current_time.year, 12, 31).isoformat() + 'Z'
-                
-                events_result = service.events().list(calendarId=calendar_id,
-                                                        timeMin=year_start,
-                                                        timeMax=year_end,
-                                                        maxResults=100, singleEvents=True,
-                                                        orderBy='startTime').execute()
-                events = events_result.get('items', [])
-
-                holidays = []
-                for event in events:
+    async def for_year(self, year):
+        missing = [calendar_id for calendar_id in self.calendar_ids if (calendar_id, year) not in self._entries]
+        for calendar_id in self.calendar_ids:
+            result = 'miss' if calendar_id in missing else 'stale' if self._is_stale((calendar_id, year)) else 'hit'
+            metrics.inc('bot_cache_requests_total', cache='holidays', result=result)
+        fetch = [calendar_id for calendar_id in missing if not self._backing_off((calendar_id, year))]
+        if fetch:
+            await asyncio.gather(*(self.refresh(calendar_id, year) for calendar_id in fetch))
+        self._revalidate(year, skip=fetch)
+
+        merged = self._merged.get(year)
+        if merged is None:
+            holidays = list(heapq.merge(
+                *(self._entries[(calendar_id, year)]['holidays']
+                  for calendar_id in self.calendar_ids if (calendar_id, year) in self._entries),
+                key=lambda x: x['date']
+            ))
+            merged = self._merged[year] = ([h['date'] for h in holidays], holidays)
+        return merged
+
+    async def get_holidays(self, year):
+        return (await self.for_year(year))[1]
+
+    async def remaining(self, date):
+        # Holidays from date to the end of its year
+        dates, holidays = await self.for_year(date.year)
+        return holidays[bisect.bisect_left(dates, date.strftime('%Y-%m-%d')):]
+
+    async def on_date(self, date):
+        dates, holidays = await self.for_year(date.year)
+        date_str = date.strftime('%Y-%m-%d')
+        return holidays[bisect.bisect_left(dates, date_str):bisect.bisect_right(dates, date_str)]
+
+    def _is_stale(self, key):
+        entry = self._entries.get(key)
+        return entry is None or datetime.now().timestamp() - entry['fetched_at'] >= self.cache_expiry
+
+    def _backing_off(self, key):
+        failed_at = self._failed_at.get(key)
+        return failed_at is not None and datetime.now().timestamp() - failed_at < self.retry_interval
+
+    def _revalidate(self, year, skip=()):
+        # skip holds the calendars just fetched for this call, successfully or not
+        for calendar_id in self.calendar_ids:
+            key = (calendar_id, year)
+            if calendar_id not in skip and self._is_stale(key) and not self._backing_off(key):
+                self.refresh(calendar_id, year)
+
+    def refresh(self, calendar_id, year):
+        key = (calendar_id, year)
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._refresh(key))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so a cancelled caller does not abort the fetch other callers wait on
+        return asyncio.shield(task)
+
+    async def _refresh(self, key):
+        loop = asyncio.get_running_loop()
+        holidays = await loop.run_in_executor(self._executor, self.fetch_holidays, *key)
+        if holidays is None:
+            self._failed_at[key] = datetime.now().timestamp()
+            return  # Keep serving whatever we had
+        self._failed_at.pop(key, None)
+        self._entries[key] = {'fetched_at': datetime.now().timestamp(), 'holidays': holidays}
+        self._merged.pop(key[1], None)
+        self.version += 1
+        data = {f"{calendar_id}|{year}": entry for (calendar_id, year), entry in self._entries.items()}
+        try:
+            await loop.run_in_executor(self._executor, self._save, data)
+        except Exception as e:
+            logger.error(f"Error saving holiday cache: {str(e)}")
+
+    def fetch_holidays(self, calendar_id, year):
+        logger.info(f"Fetching holidays for {year} from {calendar_id}")
+        service = self.get_google_calendar_service()
+        if service is None:
+            logger.error("Failed to get Google Calendar service")
+            return None
+        try:
+            # Set time range for the whole year
+            year_start = datetime(year, 1, 1).isoformat() + 'Z'
+            year_end = datetime(year + 1, 1, 1).isoformat() + 'Z'
+
+            holidays = []
+            page_token = None
+            while True:
+                with metrics.timer('bot_google_api_seconds', method='events.list'):
+                    events_result = service.events().list(calendarId=calendar_id,
+                                                            timeMin=year_start,
+                                                            timeMax=year_end,
+                                                            maxResults=250, singleEvents=True,
+                                                            orderBy='startTime',
+                                                            pageToken=page_token).execute()
+                for event in events_result.get('items', []):
                     start = event['start'].get('date', event['start'].get('dateTime'))
                     holidays.append({
                         'name': event['summary'],
                         'date': start[:10]  # Get only the date part
                     })
+                page_token = events_result.get('nextPageToken')
+                if not page_token:
+                    break
 
-                # Sort holidays by date
-                holidays.sort(key=lambda x: x['date'])
+            # Sort holidays by date
+            holidays.sort(key=lambda x: x['date'])
+            logger.info(f"Fetched {len(holidays)} holidays for the year {year} from {calendar_id}")
+            return holidays
+        except Exception as e:
+            logger.error(f"Error fetching holidays: {str(e)}")
+            metrics.inc('bot_google_api_errors_total', method='events.list')
+            return None
 
-                self.holiday_cache = {
-                    'timestamp': current_time,
-                    'data': holidays
-                }
-                logger.info(f"Fetched {len(holidays)} holidays for the year {current_time.year}")
+    async def refresh_loop(self, check_interval=60 * 60):
+        # Keeps the current year fresh, and next year's calendars too from December on
+        while True:
+            try:
+                now = datetime.now()
+                years = [now.year, now.year + 1] if now.month == 12 else [now.year]
+                await asyncio.gather(*(
+                    self.refresh(calendar_id, year)
+                    for year in years for calendar_id in self.calendar_ids
+                    if self._is_stale((calendar_id, year))
+                ))
             except Exception as e:
-                logger.error(f"Error fetching holidays: {str(e)}")
-                return []
-        
-        return holidays
+                logger.error(f"Error in holiday refresh loop: {str(e)}")
+            await asyncio.sleep(check_interval)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+HttpRequest = collections.namedtuple('HttpRequest', ['method', 'path', 'headers', 'body'])
+
+class LocalHttpServer:
+    # Minimal HTTP/1.1 server on asyncio streams, enough for the Telegram webhook and
+    # local tooling without pulling in a web framework. routes maps (method, path) to
+    # async handlers taking an HttpRequest and returning (status, content_type, body).
+    max_body = 1024 * 1024
+
+    def __init__(self, routes, host='127.0.0.1', port=8080, fallback=None):
+        self.routes = routes
+        self.host = host
+        self.port = port
+        self.fallback = fallback
+        self._server = None
+        self._clients = {}  # writer -> task serving the connection
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            connections = list(self._clients.items())
+            for writer, _ in connections:
+                writer.close()  # Ends idle keep-alive connections
+            # Let the handlers see the closed connections and finish
+            await asyncio.gather(*(task for _, task in connections), return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        self._clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > self.max_body:
+                    await self._respond(writer, 413, 'text/plain', b'Payload Too Large', keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                path = target.split('?', 1)[0]
+                handler = self.routes.get((method, path), self.fallback)
+                if handler is None:
+                    status, content_type, payload = 404, 'text/plain', b'Not Found'
+                else:
+                    try:
+                        status, content_type, payload = await handler(HttpRequest(method, path, headers, body))
+                    except Exception as e:
+                        logger.error(f"Error handling {method} {path}: {str(e)}")
+                        status, content_type, payload = 500, 'text/plain', b'Internal Server Error'
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    async def _respond(self, writer, status, content_type, payload, keep_alive=True):
+        connection = '' if keep_alive else 'Connection: close\r\n'
+        head = (
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"{connection}\r\n"
+        )
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+def webhook_listen_address(secret):
+    # Without a secret anyone who can reach the port could post updates as any
+    # user, so that is only allowed when nothing but this host can connect
+    host = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    if not secret:
+        try:
+            loopback = ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = host == 'localhost'
+        if not loopback:
+            raise ValueError(f"WEBHOOK_SECRET must be set when the webhook listens on {host}")
+    return host
+
+def has_webhook_secret(request, secret):
+    # Compared in constant time so response timing doesn't give the secret away
+    if not secret:
+        return True
+    received = request.headers.get('x-telegram-bot-api-secret-token', '')
+    return hmac.compare_digest(received.encode('utf-8'), secret.encode('utf-8'))
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    # Runs updates concurrently across users, but one at a time and in arrival order
+    # for any single user, so a user's button taps and messages never race each other.
+    # An update takes one of the max_concurrent_updates slots only once it holds its
+    # user's lock, so updates queued behind a busy user never keep other users
+    # waiting. The base class takes its own semaphore before do_process_update,
+    # which is why that one is given no effective limit.
+    def __init__(self, max_concurrent_updates):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates must be a positive integer")
+        super().__init__(sys.maxsize)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks = {}  # user_id -> [lock, updates holding or waiting for it]
+
+    async def do_process_update(self, update, coroutine):
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+class ShardConfig:
+    # Users are partitioned across worker processes by a stable hash of their ID
+    def __init__(self, count=1, index=0):
+        if not 0 <= index < count:
+            raise ValueError(f"SHARD_INDEX must be between 0 and {count - 1}")
+        self.count = count
+        self.index = index
+
+    @staticmethod
+    def shard_of(user_id, count):
+        return zlib.crc32(str(user_id).encode('utf-8')) % count
+
+    def owns(self, user_id):
+        return self.count == 1 or self.shard_of(user_id, self.count) == self.index
+
+class SQLiteLease:
+    # A named, time-limited lease in a SQLite table. Only the process holding an
+    # unexpired lease runs the job it guards; it renews the lease while working and
+    # anyone may take it over once it expires. Works across processes sharing the file.
+    def __init__(self, path, name, ttl=15 * 60):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}-{os.getpid()}"
+
+    def _try_acquire(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('BEGIN IMMEDIATE')
+            now = datetime.now().timestamp()
+            row = conn.execute('SELECT owner, expires_at FROM leases WHERE name = ?', (self.name,)).fetchone()
+            if row is not None and row[0] != self.owner and row[1] > now:
+                conn.execute('ROLLBACK')
+                return False
+            conn.execute('INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)',
+                         (self.name, self.owner, now + self.ttl))
+            conn.execute('COMMIT')
+            return True
+        finally:
+            conn.close()
+
+    def _release(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (self.name, self.owner))
+        finally:
+            conn.close()
+
+    async def acquire(self):
+        # Acquires or renews the lease; False if another process holds it
+        return await asyncio.get_running_loop().run_in_executor(None, self._try_acquire)
+
+    async def release(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._release)
+
+    async def keep_alive(self):
+        # Renews the lease until it is lost to another process
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            if not await self.acquire():
+                logger.error(f"Lost lease {self.name} to another process")
+                return
+
+class ShardRouter:
+    # Front process for sharded deployments: receives Telegram's webhook and forwards
+    # each update to the worker that owns its user. Replies 502 when the worker can't
+    # be reached, so Telegram redelivers the update later.
+    def __init__(self, token, shard_count, worker_port):
+        self.token = token
+        self.shard_count = shard_count
+        self.worker_port = worker_port  # worker i listens on worker_port + i
+        self.webhook_path = os.getenv('WEBHOOK_PATH', '/telegram')
+        self.webhook_secret = os.getenv('WEBHOOK_SECRET')
+        self.server = LocalHttpServer(
+            {('POST', self.webhook_path): self.handle_webhook},
+            host=webhook_listen_address(self.webhook_secret),
+            port=int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')))
+        )
+
+    @staticmethod
+    def user_id_of(update):
+        for key, value in update.items():
+            if key == 'update_id' or not isinstance(value, dict):
+                continue
+            user = value.get('from') or value.get('user')
+            if user:
+                return user['id']
+            chat = value.get('chat')
+            if chat:
+                return chat['id']
+        return None
+
+    async def handle_webhook(self, request):
+        if not has_webhook_secret(request, self.webhook_secret):
+            return 403, 'text/plain', b'Forbidden'
+        try:
+            user_id = self.user_id_of(json.loads(request.body))
+        except (ValueError, AttributeError):
+            return 400, 'text/plain', b'Bad Request'
+
+        shard = ShardConfig.shard_of(user_id, self.shard_count) if user_id is not None else 0
+        try:
+            status = await self.forward(shard, request.body)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            logger.error(f"Failed to forward update to shard {shard}: {str(e)}")
+            return 502, 'text/plain', b'Bad Gateway'
+        return status, 'text/plain', b'OK' if status == 200 else b'Upstream Error'
+
+    async def forward(self, shard, body):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.worker_port + shard)
+        try:
+            secret = f"X-Telegram-Bot-Api-Secret-Token: {self.webhook_secret}\r\n" if self.webhook_secret else ''
+            writer.write((
+                f"POST {self.webhook_path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n{secret}\r\n"
+            ).encode('latin-1') + body)
+            await writer.drain()
+            return int((await reader.readline()).split()[1])
+        finally:
+            writer.close()
+
+    async def start(self):
+        await self.server.start()
+        if os.getenv('WEBHOOK_URL'):
+            bot = Bot(self.token, base_url=os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org/bot'))
+            async with bot:
+                await bot.set_webhook(
+                    url=os.getenv('WEBHOOK_URL'),
+                    secret_token=self.webhook_secret,
+                    max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+                )
+            logger.info(f"Webhook registered at {os.getenv('WEBHOOK_URL')}")
+
+    async def stop(self):
+        await self.server.stop()
+
+async def run_sharded(worker_count):
+    # Runs the router in this process and one webhook worker per shard as child
+    # processes, restarting any worker that exits. All workers must share a SQLite store.
+    token = os.getenv('BOT_TOKEN')
+    worker_port = int(os.getenv('SHARD_WORKER_PORT', '8100'))
+    router = ShardRouter(token, worker_count, worker_port)
+    stopping = False
+
+    async def supervise(index):
+        env = dict(os.environ)
+        env.pop('WEBHOOK_URL', None)  # Only the router registers the webhook
+        env.update({
+            'SHARD_COUNT': str(worker_count),
+            'SHARD_INDEX': str(index),
+            'BOT_MODE': 'webhook',
+            'WEBHOOK_LISTEN': '127.0.0.1',
+            'WEBHOOK_PORT': str(worker_port + index),
+        })
+        if os.getenv('METRICS_PORT'):
+            env['METRICS_PORT'] = str(int(os.getenv('METRICS_PORT')) + index)
+        while not stopping:
+            process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), env=env)
+            logger.info(f"Started shard {index} worker (pid {process.pid})")
+            try:
+                code = await process.wait()
+            except asyncio.CancelledError:
+                process.terminate()
+                await process.wait()
+                raise
+            if not stopping:
+                logger.error(f"Shard {index} worker exited with code {code}, restarting")
+                await asyncio.sleep(1)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop_event.set)
+
+    workers = [asyncio.create_task(supervise(index)) for index in range(worker_count)]
+    await router.start()
+    stopper = asyncio.create_task(stop_event.wait())
+    try:
+        await asyncio.wait([stopper, *workers], return_when=asyncio.FIRST_COMPLETED)
+        logger.info("Shutting down shard workers")
+    finally:
+        stopping = True
+        stopper.cancel()
+        # Stop taking updates first; each worker then gets SIGTERM and shuts down
+        # gracefully within its own SHUTDOWN_TIMEOUT
+        await router.stop()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+class NotificationScheduler:
+    # Fires every reminder notification at its own instant in the user's timezone:
+    # the day before at notify_time, and on the day at the reminder's time (or at
+    # notify_time when it has none). Holidays are announced to every user at
+    # notify_time the day before and on the day. Jobs sit in a min-heap that is
+    # planned a few hours ahead from the store's date index, and everything due for
+    # a user in one pass goes out as a single digest. The instant up to which
+    # everything has been sent is persisted, so a restart picks up from there
+    # instead of re-sending or skipping, and the loop never sleeps longer than a
+    # minute so it follows the wall clock rather than drifting from it. While a pass
+    # is sending, the digests already delivered are checkpointed too, so a pass cut
+    # short by a shutdown is finished after the restart without repeating any of them.
+    def __init__(self, store, sender, shard, lease=None, default_timezone=None,
+                 notify_time=time(hour=6, minute=0), horizon=12 * 60 * 60, catch_up=6 * 60 * 60,
+                 holidays=None):
+        self.store = store
+        self.sender = sender
+        self.shard = shard
+        self.lease = lease
+        self.holidays = holidays
+        self.default_timezone = default_timezone  # None means the server's local time
+        self.notify_time = notify_time
+        self.horizon = horizon
+        self.catch_up = catch_up  # How far back missed notifications are still sent after downtime
+        self.watermark_key = f"notified_until-{shard.index}-of-{shard.count}"
+        self.checkpoint_key = f"notify_checkpoint-{shard.index}-of-{shard.count}"
+        self.checkpoint_interval = 5  # Seconds between checkpoints while a pass is sending
+        self.stopping = False
+        self._heap = []  # (fire_at, seq, user_id, Reminder or holiday ordinal, kind)
+        self._seq = itertools.count()
+        self._holiday_days = set()  # ordinals of planned days that have holidays
+        self._planned_until = None
+        self._fired_until = None  # Everything due up to this instant has been sent
+        self._timezones = {}  # user_id -> tzinfo
+        self._wakeup = None
+
+    @staticmethod
+    def now():
+        return datetime.now(timezone.utc).timestamp()
+
+    def stop(self):
+        # The pass in progress finishes sending; run() then returns
+        self.stopping = True
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _sleep(self, seconds):
+        # Like asyncio.sleep, but cut short by stop()
+        if self.stopping:
+            return
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=max(seconds, 0))
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while not self.stopping:
+            try:
+                if self.lease is None:
+                    await self._run()
+                    continue
+                while not await self.lease.acquire():
+                    # Retried often enough that a standby takes over soon after a
+                    # shutdown releases the lease
+                    await self._sleep(min(self.lease.ttl / 3, 30))
+                    if self.stopping:
+                        return
+                logger.info(f"Acquired notifier lease {self.lease.name}")
+                holder = asyncio.create_task(self.lease.keep_alive())
+                scheduler = asyncio.create_task(self._run())
+                try:
+                    done, _ = await asyncio.wait({holder, scheduler}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    holder.cancel()
+                    scheduler.cancel()
+                    # Lets a pass that is being cut short write its checkpoint
+                    await asyncio.gather(holder, scheduler, return_exceptions=True)
+                if scheduler in done:
+                    scheduler.result()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in notification scheduler: {str(e)}")
+                await self._sleep(60)  # Wait for 1 minute before retrying if there's an error
+
+    async def _run(self):
+        self._heap = []
+        now = self.now()
+        watermark = await self.store.get_meta(self.watermark_key)
+        self._planned_until = max(float(watermark), now - self.catch_up) if watermark else now
+        self._fired_until = self._planned_until
+        expired_through = None
+
+        checkpoint = await self.store.get_meta(self.checkpoint_key)
+        if checkpoint:
+            checkpoint = json.loads(checkpoint)
+            if checkpoint['until'] > now - self.catch_up:
+                # The last pass was cut short: plan its window again and finish it,
+                # skipping what it already sent
+                logger.info(f"Resuming notification pass with {len(checkpoint['done'])} digests already sent")
+                self._fired_until = max(checkpoint['from'], now - self.catch_up)
+                await self._plan(self._fired_until, checkpoint['until'])
+                await self._fire_due(checkpoint['until'], done=checkpoint['done'])
+            else:
+                logger.warning(
+                    f"Discarding the checkpoint of a notification pass up to "
+                    f"{datetime.fromtimestamp(checkpoint['until'])}, older than the catch-up window"
+                )
+                await self.store.set_meta(self.checkpoint_key, None)
+
+        while not self.stopping:
+            now = self.now()
+            today = datetime.now(timezone.utc).date()
+            if expired_through != today:
+                # Two days of slack so no timezone still has the reminder ahead of it
+                expired = await self.store.expire_before((today - timedelta(days=2)).toordinal())
+                if expired:
+                    logger.info(f"Expired {expired} past reminders")
+                expired_through = today
+
+            if self._planned_until < now + self.horizon / 2:
+                await self._plan(self._planned_until, now + self.horizon)
+
+            if self._heap and self._heap[0][0] <= now:
+                await self._fire_due(now)
+                continue
+
+            await self._sleep(min(60, self._heap[0][0] - now) if self._heap else 60)
+
+    async def _plan(self, start, end):
+        # A reminder dated D fires between D-1 06:00 and D 23:59 local time, which is
+        # within a day either side of D in UTC
+        day = datetime.fromtimestamp(start, timezone.utc).date() - timedelta(days=1)
+        last = datetime.fromtimestamp(end, timezone.utc).date() + timedelta(days=2)
+        self._holiday_days = {ordinal for ordinal in self._holiday_days if ordinal >= day.toordinal()}
+        planned = 0
+        users = None
+        while day <= last:
+            due = [(user_id, reminder) for user_id, reminder in await self.store.due_on(day.toordinal())
+                   if self.shard.owns(user_id)]
+            timezones = await self._timezones_for({user_id for user_id, _ in due})
+            for user_id, reminder in due:
+                planned += self._push(user_id, reminder, timezones[user_id], start, end)
+
+            if self.holidays and await self.holidays.on_date(day):
+                if users is None:
+                    users = [user_id for user_id in await self.store.user_ids() if self.shard.owns(user_id)]
+                timezones = await self._timezones_for(users)
+                self._holiday_days.add(day.toordinal())
+                for user_id in users:
+                    planned += self._push_holiday(user_id, day.toordinal(), timezones[user_id], start, end)
+            day += timedelta(days=1)
+        self._planned_until = end
+        logger.info(f"Planned {planned} notifications up to {datetime.fromtimestamp(end)}")
+
+    def _push(self, user_id, reminder, tz, after, until):
+        return self._push_times(user_id, reminder, self.fire_times(reminder, tz), after, until)
+
+    def _push_holiday(self, user_id, ordinal, tz, after, until):
+        return self._push_times(user_id, ordinal, self.holiday_fire_times(ordinal, tz), after, until)
+
+    def _push_times(self, user_id, key, times, after, until):
+        pushed = 0
+        for fire_at, kind in times:
+            if after < fire_at <= until:
+                heapq.heappush(self._heap, (fire_at, next(self._seq), user_id, key, kind))
+                pushed += 1
+        return pushed
+
+    def fire_times(self, reminder, tz):
+        day = date.fromordinal(reminder.ordinal)
+        times = [(datetime.combine(day - timedelta(days=1), self.notify_time), 'tomorrow')]
+        if reminder.minute >= 0:
+            times.append((datetime.combine(day, time(reminder.minute // 60, reminder.minute % 60)), 'due'))
+        else:
+            times.append((datetime.combine(day, self.notify_time), 'today'))
+        return [((local.replace(tzinfo=tz) if tz else local).timestamp(), kind) for local, kind in times]
+
+    def holiday_fire_times(self, ordinal, tz):
+        day = date.fromordinal(ordinal)
+        times = [
+            (datetime.combine(day - timedelta(days=1), self.notify_time), 'holiday_tomorrow'),
+            (datetime.combine(day, self.notify_time), 'holiday_today')
+        ]
+        return [((local.replace(tzinfo=tz) if tz else local).timestamp(), kind) for local, kind in times]
+
+    async def _timezones_for(self, user_ids):
+        missing = [user_id for user_id in user_ids if user_id not in self._timezones]
+        if missing:
+            for user_id, name in (await self.store.get_timezones(missing)).items():
+                self._timezones[user_id] = resolve_timezone(name, self.default_timezone)
+        return {user_id: self._timezones[user_id] for user_id in user_ids}
+
+    async def add_reminder(self, user_id, reminder):
+        # Reminders saved after their window was planned are pushed directly
+        if self._planned_until is None or not self.shard.owns(user_id):
+            return
+        tz = (await self._timezones_for([user_id]))[user_id]
+        if self._push(user_id, reminder, tz, self.now(), self._planned_until):
+            self._wakeup.set()
+
+    async def reschedule_user(self, user_id):
+        # Called after a timezone change: drop the user's planned jobs and plan them again
+        self._timezones.pop(user_id, None)
+        if self._planned_until is None:
+            return
+        self._heap = [job for job in self._heap if job[2] != user_id]
+        heapq.heapify(self._heap)
+        for reminder in await self.store.get_user(user_id):
+            await self.add_reminder(user_id, reminder)
+        if self.shard.owns(user_id):
+            tz = (await self._timezones_for([user_id]))[user_id]
+            for ordinal in self._holiday_days:
+                self._push_holiday(user_id, ordinal, tz, self.now(), self._planned_until)
+        self._wakeup.set()
+
+    async def _fire_due(self, now, done=()):
+        jobs = []
+        while self._heap and self._heap[0][0] <= now:
+            jobs.append(heapq.heappop(self._heap))
+
+        # Everything due for a user in this pass is merged into one digest
+        digests = {}  # user_id -> (holiday lines, reminder lines)
+        # Reminder jobs carry the Reminder from due_on; only check it wasn't deleted since
+        stored = await self.store.existing(
+            [(user_id, key.id) for _, _, user_id, key, kind in jobs if not kind.startswith('holiday_')]
+        )
+        for _, _, user_id, key, kind in jobs:
+            holiday_lines, reminder_lines = digests.setdefault(user_id, ([], []))
+            if kind.startswith('holiday_'):
+                for holiday in await self.holidays.on_date(date.fromordinal(key)):
+                    holiday_lines.append(self.format_holiday(holiday, kind))
+                continue
+            if key.id not in stored:
+                continue  # Deleted after it was planned
+            reminder_lines.append(self.format_notification(key, kind))
+
+        # Digests are keyed '<user_id>:<chunk>'; done holds the keys a previous,
+        # interrupted run of this pass already sent
+        done = set(done)
+        messages = [
+            (key, user_id, chunk)
+            for user_id, (holiday_lines, reminder_lines) in digests.items()
+            for number, chunk in enumerate(split_message(holiday_lines + reminder_lines))
+            for key in [f"{user_id}:{number}"] if key not in done
+        ]
+        sending = asyncio.ensure_future(self.sender.send_all(
+            [(user_id, chunk) for _, user_id, chunk in messages],
+            label='notification digests',
+            on_result=lambda position: done.add(messages[position][0])
+        ))
+        checkpointed = len(done)
+        try:
+            while not sending.done():
+                await asyncio.wait({sending}, timeout=self.checkpoint_interval)
+                if len(done) > checkpointed and not sending.done():
+                    checkpointed = len(done)
+                    await self._checkpoint(now, done)
+            sending.result()
+        except asyncio.CancelledError:
+            # Out of time: sends in flight may or may not arrive and go out again
+            # after the restart, everything confirmed is skipped
+            sending.cancel()
+            await self._checkpoint(now, done)
+            raise
+
+        unsent = sum(1 for key, _, _ in messages if key not in done)
+        if unsent:
+            # The sender was stopped mid-pass; the rest goes out after the restart
+            await self._checkpoint(now, done)
+            logger.info(f"Stopped with {unsent} notification digests unsent, checkpointed for the next run")
+            return
+        await self.store.set_meta(self.watermark_key, repr(now))
+        await self.store.set_meta(self.checkpoint_key, None)
+        self._fired_until = now
+
+    async def _checkpoint(self, now, done):
+        # The pass covers everything due after _fired_until up to now
+        await self.store.set_meta(self.checkpoint_key, json.dumps(
+            {'from': self._fired_until, 'until': now, 'done': sorted(done)}
+        ))
+
+    @staticmethod
+    def format_notification(reminder, kind):
+        if kind == 'due':
+            return f"⏰ Reminder for now ({reminder.time_str}): {reminder.description}"
+        if kind == 'tomorrow' and reminder.minute >= 0:
+            return f"⏰ Reminder for tomorrow at {reminder.time_str}: {reminder.description}"
+        return f"⏰ Reminder for {kind}: {reminder.description}"
+
+    @staticmethod
+    def format_holiday(holiday, kind):
+        return f"🎉 {'Today' if kind == 'holiday_today' else 'Tomorrow'} is {holiday['name']}!"
+
+def resolve_timezone(name, default=None):
+    if not name:
+        return default
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {name}, using the default")
+        return default
+
+def split_message(lines, limit=4096):
+    # Packs lines into as few messages as Telegram's length limit allows, breaking
+    # only between lines; a single line longer than the limit is cut into pieces
+    chunks, current, size = [], [], 0
+    for line in lines:
+        for piece in (line[i:i + limit] for i in range(0, max(len(line), 1), limit)):
+            if current and size + 1 + len(piece) > limit:
+                chunks.append('\n'.join(current))
+                current, size = [], 0
+            size += len(piece) + (1 if current else 0)
+            current.append(piece)
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+# Largest file the Bot API lets a bot download
+TELEGRAM_DOWNLOAD_LIMIT = 20 * 1024 * 1024
+
+def reminder_entry(description, date_str, time_str=None):
+    # (description, ordinal, minute) for the store; raises ValueError on bad input
+    description = description.strip()
+    if not description:
+        raise ValueError("Empty description")
+    if time_str:
+        due = datetime.strptime(f"{date_str.strip()} {time_str.strip()}", '%Y-%m-%d %H:%M')
+        return description, due.toordinal(), due.hour * 60 + due.minute
+    return description, datetime.strptime(date_str.strip(), '%Y-%m-%d').toordinal(), -1
+
+def parse_reminder_line(line):
+    # 'Description, YYYY-MM-DD' or 'Description, YYYY-MM-DD HH:MM'
+    description, when = line.rsplit(',', 1)
+    date_str, _, time_str = when.strip().partition(' ')
+    return reminder_entry(description, date_str, time_str)
+
+# The iter_*_reminders parsers read their input lazily and yield
+# (line number, entry), with None as the entry for lines they could not parse
+
+def iter_text_reminders(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, parse_reminder_line(line)
+        except ValueError:
+            yield number, None
+
+def iter_csv_reminders(lines):
+    # Columns are description, date and an optional time; a header row naming
+    # them may come first and put them in any order
+    columns = (0, 1, 2)
+    for number, row in enumerate(csv.reader(lines), 1):
+        if not any(cell.strip() for cell in row):
+            continue
+        header = [cell.strip().lower() for cell in row]
+        if number == 1 and 'date' in header:
+            columns = (
+                header.index('description') if 'description' in header else 0,
+                header.index('date'),
+                header.index('time') if 'time' in header else None
+            )
+            continue
+        try:
+            time_str = row[columns[2]] if columns[2] is not None and columns[2] < len(row) else None
+            yield number, reminder_entry(row[columns[0]], row[columns[1]], time_str)
+        except (IndexError, ValueError):
+            yield number, None
+
+def iter_ics_reminders(lines, tz=None):
+    # One entry per VEVENT, from its SUMMARY and DTSTART. Times in UTC or with a
+    # TZID are converted to tz; floating times are taken as they are.
+    event = None
+    for number, line in _unfold_ics(lines):
+        name, _, value = line.partition(':')
+        name, _, params = name.partition(';')
+        name = name.upper()
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event, start = {}, number
+        elif name == 'END' and value.upper() == 'VEVENT' and event is not None:
+            yield start, _ics_entry(event, tz)
+            event = None
+        elif event is not None and name in ('SUMMARY', 'DTSTART'):
+            event[name] = (params, value.strip())
+
+def _unfold_ics(lines):
+    # Joins folded continuation lines back onto the line they belong to
+    current = None
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if current is not None and line[:1] in (' ', '\t'):
+            current = (current[0], current[1] + line[1:])
+            continue
+        if current is not None:
+            yield current
+        current = (number, line)
+    if current is not None:
+        yield current
+
+def _ics_entry(event, tz):
+    if 'SUMMARY' not in event or 'DTSTART' not in event:
+        return None
+    description = re.sub(r'\\([\\;,nN])', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), event['SUMMARY'][1])
+    params, start = event['DTSTART']
+    try:
+        if 'T' not in start:
+            return reminder_entry(description, datetime.strptime(start[:8], '%Y%m%d').date().isoformat())
+        due = datetime.strptime(start[:15], '%Y%m%dT%H%M%S')
+        tzid = re.search(r'TZID=([^;]+)', params, re.IGNORECASE)
+        source = timezone.utc if start.endswith('Z') else resolve_timezone(tzid.group(1).strip('"')) if tzid else None
+        if source:
+            due = due.replace(tzinfo=source).astimezone(tz)
+        return reminder_entry(description, due.date().isoformat(), due.strftime('%H:%M'))
+    except ValueError:
+        return None
+
+def csv_export_rows(reminders):
+    yield ('description', 'date', 'time')
+    for reminder in reminders:
+        yield (reminder.description, reminder.date_str, reminder.time_str or '')
+
+def ics_export_lines(reminders, timezone_name=None):
+    # Timed reminders carry the user's timezone as TZID, or float when none is set
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield 'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Calendar Notification Bot//EN\r\n'
+    for reminder in reminders:
+        day = date.fromordinal(reminder.ordinal).strftime('%Y%m%d')
+        if reminder.minute < 0:
+            start = f"DTSTART;VALUE=DATE:{day}"
+        else:
+            local = f"{day}T{reminder.minute // 60:02d}{reminder.minute % 60:02d}00"
+            start = f"DTSTART;TZID={timezone_name}:{local}" if timezone_name else f"DTSTART:{local}"
+        summary = re.sub(r'([\\;,])', r'\\\1', reminder.description).replace('\n', '\\n')
+        yield (
+            f"BEGIN:VEVENT\r\nUID:reminder-{reminder.id}@calendar-notification-bot\r\n"
+            f"DTSTAMP:{stamp}\r\n{start}\r\n{_fold_ics('SUMMARY:' + summary)}END:VEVENT\r\n"
+        )
+    yield 'END:VCALENDAR\r\n'
+
+def _fold_ics(line):
+    # Content lines are folded at 75 octets
+    parts, part, size = [], '', 0
+    for char in line:
+        length = len(char.encode('utf-8'))
+        if size + length > 75:
+            parts.append(part)
+            part, size = ' ', 1
+        part += char
+        size += length
+    parts.append(part)
+    return '\r\n'.join(parts) + '\r\n'
+
+class CalendarBot:
+    def __init__(self):
+        load_dotenv()
+        self.token = os.getenv('BOT_TOKEN')
+        if not self.token:
+            raise ValueError("No token provided")
+        self.application = None
+        self.holidays = HolidayProvider(
+            calendar_ids=[c.strip() for c in os.getenv('HOLIDAY_CALENDARS', DEFAULT_HOLIDAY_CALENDAR).split(',') if c.strip()],
+            cache_path=os.getenv('HOLIDAY_CACHE_PATH', 'holidays.json'),
+            discovery=os.getenv('GOOGLE_DISCOVERY', 'static'),
+            discovery_cache=FileDiscoveryCache(os.getenv('GOOGLE_DISCOVERY_CACHE_DIR', '.discovery_cache'))
+        )
+        self.shard = ShardConfig(int(os.getenv('SHARD_COUNT', '1')), int(os.getenv('SHARD_INDEX', '0')))
+        self.store = create_reminder_store(self.shard)
+        self.sender = None
+        self.scheduler = None
+        self.default_timezone = resolve_timezone(os.getenv('DEFAULT_TIMEZONE'))
+        self.page_size = int(os.getenv('REMINDERS_PAGE_SIZE', '10'))
+        self.import_batch_size = 500
+        self.render_cache = RenderCache(int(os.getenv('RENDER_CACHE_SIZE', '10000')))
+        # Only one process per shard may send notifications
+        self.notifier_lease = None
+        if isinstance(self.store, SQLiteReminderStore):
+            self.notifier_lease = SQLiteLease(
+                self.store.path, f"notifier-{self.shard.index}-of-{self.shard.count}"
+            )
+        self.mode = os.getenv('BOT_MODE', 'polling')  # polling or webhook
+        self.webhook_path = os.getenv('WEBHOOK_PATH', '/telegram')
+        self.webhook_secret = os.getenv('WEBHOOK_SECRET')
+        self.webhook_listen = webhook_listen_address(self.webhook_secret) if self.mode == 'webhook' else None
+        self.webhook_server = None
+        self.metrics_server = None
+        self.notification_task = None
+        self.holiday_refresh_task = None
+        self.loop_monitor_task = None
+        self.stop_event = None
+        # How long a shutdown waits for handlers and the notification pass in progress
+        self.shutdown_timeout = float(os.getenv('SHUTDOWN_TIMEOUT', '20'))
+        log_sample_rate = float(os.getenv('LOG_SAMPLE_RATE', '1'))
+        if log_sample_rate < 1:
+            logger.addFilter(SampledLogFilter(log_sample_rate))
+        # Callback data is '<route>' or '<route>:<arguments>'; handle_callback answers
+        # the query and hands it to the route's handler
+        self.callback_routes = {
+            'add_reminder': self.add_reminder,
+            'list_reminders': self.list_reminders,
+            'list_page': self.list_reminders,
+            'list_holidays': self.list_holidays,
+            'delete_reminder': self.delete_reminder,
+            'delete_page': self.delete_reminder,
+            'delete_id': self.handle_delete_reminder,
+            'start': self.start,
+            'cancel_delete': self.start,
+        }
+        logger.info("Bot initialized")
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        logger.info("Start method called")
+        logger.info("Start method called", extra=PER_REQUEST)
         # Reset conversation state
         context.user_data.clear()
         
@@ -142,15 +2163,14 @@ class CalendarBot:
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         if update.callback_query:
-            logger.info("Handling callback query in start method")
-            await update.callback_query.answer()
+            logger.info("Handling callback query in start method", extra=PER_REQUEST)
             await update.callback_query.edit_message_text(
                 'Welcome to Calendar Notification Bot!\n'
                 'What would you like to do?',
                 reply_markup=reply_markup
             )
         else:
-            logger.info("Handling message in start method")
+            logger.info("Handling message in start method", extra=PER_REQUEST)
             await update.message.reply_text(
                 'Welcome to Calendar Notification Bot!\n'
                 'What would you like to do?',
@@ -159,9 +2179,13 @@ class CalendarBot:
         return CHOOSING_ACTION
 
     async def add_reminder(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        logger.info("Add reminder method called")
+        logger.info("Add reminder method called", extra=PER_REQUEST)
         query = update.callback_query
-        await query.edit_message_text("Please enter your reminder in the format: Description, YYYY-MM-DD")
+        await query.edit_message_text(
+            "Please enter your reminder in the format: Description, YYYY-MM-DD\n"
+            "Add a time to be reminded at that time: Description, YYYY-MM-DD HH:MM\n\n"
+            "Send one reminder per line to add several at once, or upload a CSV or ICS file."
+        )
         context.user_data['expecting_reminder'] = True
 
     async def save_reminder(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -169,192 +2193,273 @@ class CalendarBot:
             return
 
         text = update.message.text
+        user_id = str(update.effective_user.id)
         try:
-            description, date_str = map(str.strip, text.split(','))
-            date = datetime.strptime(date_str, '%Y-%m-%d')
-            
-            user_id = str(update.effective_user.id)
-            if user_id not in self.reminders:
-                self.reminders[user_id] = []
-                
-            self.reminders[user_id].append({
-                'description': description,
-                'date': date.strftime('%Y-%m-%d')  # Ensure consistent date format
-            })
+            if '\n' in text.strip():
+                imported, skipped = await self.import_reminders(user_id, iter_text_reminders(text.splitlines()))
+                await update.message.reply_text(self.import_summary(imported, skipped))
+                return
+
+            description, ordinal, minute = parse_reminder_line(text)
+            reminder = await self.store.add(user_id, description, ordinal, minute)
+            if self.scheduler:
+                await self.scheduler.add_reminder(user_id, reminder)
             
+            when = f"at {reminder.time_str} on the day" if minute >= 0 else "on the day of the reminder"
             await update.message.reply_text(
-                f"Reminder set for {date_str}:\n{description}\n"
-                f"You will be notified one day before and on the day of the reminder."
+                f"Reminder set for {self.format_when(reminder)}:\n{description}\n"
+                f"You will be notified one day before and {when}."
             )
         except Exception as e:
             logger.error(f"Error saving reminder: {str(e)}")
             await update.message.reply_text(
-                "Invalid format. Please use: Description, YYYY-MM-DD"
+                "Invalid format. Please use: Description, YYYY-MM-DD or Description, YYYY-MM-DD HH:MM"
             )
         finally:
             context.user_data['expecting_reminder'] = False
 
+    async def import_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        document = update.message.document
+        name = (document.file_name or '').lower()
+        if name.endswith('.ics') or document.mime_type == 'text/calendar':
+            kind = 'ics'
+        elif name.endswith('.csv') or document.mime_type == 'text/csv':
+            kind = 'csv'
+        else:
+            await update.message.reply_text("Send a .csv or .ics file to import reminders.")
+            return
+        if document.file_size and document.file_size > TELEGRAM_DOWNLOAD_LIMIT:
+            await update.message.reply_text("That file is too large to import; the limit is 20 MB.")
+            return
+
+        user_id = str(update.effective_user.id)
+        try:
+            # Small files stay in memory and larger ones spill to disk; either way
+            # the parser reads the file a line at a time
+            with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as buffer:
+                await (await document.get_file()).download_to_memory(buffer)
+                buffer.seek(0)
+                lines = io.TextIOWrapper(buffer, encoding='utf-8-sig', errors='replace', newline='')
+                if kind == 'csv':
+                    parsed = iter_csv_reminders(lines)
+                else:
+                    tz = resolve_timezone((await self.store.get_timezones([user_id]))[user_id], self.default_timezone)
+                    parsed = iter_ics_reminders(lines, tz)
+                imported, skipped = await self.import_reminders(user_id, parsed)
+                lines.detach()
+        except Exception as e:
+            logger.error(f"Error importing {document.file_name}: {str(e)}")
+            await update.message.reply_text("Sorry, that file could not be imported.")
+            return
+        await update.message.reply_text(self.import_summary(imported, skipped))
+
+    async def import_reminders(self, user_id, parsed):
+        # Stores parsed entries in batches, yielding to other updates in between.
+        # Returns the number imported and (count, first few line numbers) of those skipped.
+        imported, skipped_count, skipped_lines, batch = 0, 0, [], []
+        for number, entry in parsed:
+            if entry is None:
+                skipped_count += 1
+                if len(skipped_lines) < 10:
+                    skipped_lines.append(number)
+                continue
+            batch.append(entry)
+            if len(batch) >= self.import_batch_size:
+                imported += await self._import_batch(user_id, batch)
+                batch = []
+        if batch:
+            imported += await self._import_batch(user_id, batch)
+        return imported, (skipped_count, skipped_lines)
+
+    async def _import_batch(self, user_id, batch):
+        reminders = await self.store.add_many(user_id, batch)
+        if self.scheduler:
+            for reminder in reminders:
+                await self.scheduler.add_reminder(user_id, reminder)
+        await asyncio.sleep(0)
+        return len(reminders)
+
+    @staticmethod
+    def import_summary(imported, skipped):
+        skipped_count, skipped_lines = skipped
+        summary = f"Imported {imported} reminder{'' if imported == 1 else 's'}."
+        if skipped_count:
+            lines = ', '.join(map(str, skipped_lines)) + (', ...' if skipped_count > len(skipped_lines) else '')
+            summary += f"\nSkipped {skipped_count} line{'' if skipped_count == 1 else 's'} that could not be read: {lines}"
+        return summary
+
+    async def export_reminders(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        kind = context.args[0].lower() if context.args else 'csv'
+        if kind not in ('csv', 'ics'):
+            await update.message.reply_text("Usage: /export csv or /export ics")
+            return
+
+        user_id = str(update.effective_user.id)
+        reminders = await self.store.get_user(user_id)
+        if not reminders:
+            await update.message.reply_text("You have no reminders to export.")
+            return
+        count = len(reminders)
+        timezone_name = (await self.store.get_timezones([user_id]))[user_id]
+
+        # PTB reads a document fully into memory to upload it, so it is built there
+        buffer = io.StringIO(newline='')
+        if kind == 'csv':
+            csv.writer(buffer).writerows(csv_export_rows(reminders))
+        else:
+            buffer.writelines(ics_export_lines(reminders, timezone_name))
+        await update.message.reply_document(
+            document=InputFile(buffer.getvalue().encode('utf-8'), filename=f"reminders.{kind}"),
+            caption=f"{count} reminder{'' if count == 1 else 's'}"
+        )
+
     async def list_reminders(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        logger.info("List reminders method called")
+        logger.info("List reminders method called", extra=PER_REQUEST)
         query = update.callback_query
-        await query.answer()
         
         user_id = str(update.effective_user.id)
-        if user_id not in self.reminders or not self.reminders[user_id]:
-            await query.edit_message_text("You have no reminders set.")
-            return
-        
-        today = datetime.now().date()
-        active_reminders = []
-        for reminder in self.reminders[user_id]:
-            reminder_date = datetime.strptime(reminder['date'], '%Y-%m-%d').date()
-            if reminder_date >= today:
-                active_reminders.append(reminder)
-        
-        # Update user's reminders, removing past ones
-        self.reminders[user_id] = active_reminders
+        after = await self.page_cursor(user_id, query.data)
+        # A page is fully determined by the user's reminders and the cursor
+        key = ('reminders', user_id, self.store.version(user_id), after.ordinal, after.minute, after.id)
+        rendered = self.render_cache.get(key)
+        if rendered is None:
+            reminders, has_more = await self.store.page(user_id, after, self.page_size)
+            rendered = self.render_reminder_page(query.data, reminders, has_more)
+            self.render_cache.set(key, rendered)
         
-        if not active_reminders:
-            await query.edit_message_text("You have no active reminders.")
-            return
+        text, reply_markup = rendered
+        await query.edit_message_text(text, reply_markup=reply_markup)
+
+    def render_reminder_page(self, callback_data, reminders, has_more):
+        if not reminders:
+            return "You have no active reminders.", InlineKeyboardMarkup(
+                [[InlineKeyboardButton("Back to Main Menu", callback_data='start')]]
+            )
         
-        # Sort reminders by date
-        sorted_reminders = sorted(
-            active_reminders,
-            key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d')
+        reminder_text = "Your active reminders:\n\n" + "\n".join(
+            f"📅 {self.format_when(reminder)}: {reminder.description}" for reminder in reminders
         )
         
-        reminder_text = "Your active reminders:\n\n"
-        for reminder in sorted_reminders:
-            reminder_text += f"📅 {reminder['date']}: {reminder['description']}\n"
-        
-        await query.edit_message_text(reminder_text)
-        
-        # Add a button to go back to the main menu
-        keyboard = [[InlineKeyboardButton("Back to Main Menu", callback_data='start')]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text("What would you like to do next?", reply_markup=reply_markup)
+        # Page navigation and a button to go back to the main menu
+        keyboard = self.page_buttons('list_page', callback_data, reminders, has_more)
+        keyboard.append([InlineKeyboardButton("Back to Main Menu", callback_data='start')])
+        return reminder_text, InlineKeyboardMarkup(keyboard)
+
+    async def page_cursor(self, user_id, callback_data):
+        # Pages are addressed by the sort key of the last reminder on the previous
+        # page ('<prefix>:<ordinal>:<minute>:<id>'), so they stay put when other
+        # reminders are added, deleted or expire. The first page starts at today.
+        if ':' in callback_data:
+            ordinal, minute, reminder_id = map(int, callback_data.split(':')[1:])
+            return Reminder(reminder_id, ordinal, minute, '')
+        return Reminder.probe((await self.local_now(user_id)).date().toordinal())
+
+    @staticmethod
+    def page_buttons(prefix, callback_data, reminders, has_more):
+        buttons = []
+        if ':' in callback_data:
+            buttons.append(InlineKeyboardButton("⏮ First page", callback_data=prefix))
+        if has_more:
+            last = reminders[-1]
+            buttons.append(InlineKeyboardButton(
+                "Next page ▶", callback_data=f"{prefix}:{last.ordinal}:{last.minute}:{last.id}"
+            ))
+        return [buttons] if buttons else []
 
     async def list_holidays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        logger.info("List holidays method called")
+        logger.info("List holidays method called", extra=PER_REQUEST)
         query = update.callback_query
-        await query.answer()
-        
-        current_time = datetime.now()
-        current_year = current_time.year
         
-        holidays = self.fetch_holidays()
-        
-        if not holidays:
-            await query.edit_message_text(f"No holidays found for {current_year}.")
-            return
-        
-        # Filter out past holidays
-        remaining_holidays = [
-            h for h in holidays 
-            if datetime.strptime(h['date'], '%Y-%m-%d').date() >= current_time.date()
-        ]
+        today = datetime.now().date()
+        # The listing is the same for every user on a given day
+        key = ('holidays', tuple(self.holidays.calendar_ids), today.toordinal(), self.holidays.version)
+        rendered = self.render_cache.get(key)
+        if rendered is None:
+            rendered = await self.render_holidays(today)
+            self.render_cache.set(key, rendered)
         
-        if not remaining_holidays:
-            await query.edit_message_text(f"No more holidays left for {current_year}.")
+        # Long lists continue in further messages, split between lines
+        chunks, found = rendered
+        await query.edit_message_text(chunks[0])
+        for chunk in chunks[1:]:
+            await query.message.reply_text(chunk)
+        if not found:
             return
         
-        # Sort remaining holidays by date
-        remaining_holidays.sort(key=lambda x: x['date'])
-        
-        holiday_list = "\n".join([f"📅 {h['date']}: {h['name']}" for h in remaining_holidays])
-        message = f"Remaining holidays for {current_year}:\n\n{holiday_list}"
-        
-        if len(message) > 4096:
-            # If message is too long, split it
-            for i in range(0, len(message), 4096):
-                await query.message.reply_text(message[i:i+4096])
-        else:
-            await query.edit_message_text(message)
-        
         # Add a button to go back to the main menu
         keyboard = [[InlineKeyboardButton("Back to Main Menu", callback_data='start')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.message.reply_text("What would you like to do next?", reply_markup=reply_markup)
 
+    async def render_holidays(self, today):
+        # (message chunks, whether any holidays are listed)
+        holidays = await self.holidays.get_holidays(today.year)
+        if not holidays:
+            return [f"No holidays found for {today.year}."], False
+        
+        # Holidays are kept sorted, so skipping past ones is a bisect
+        remaining_holidays = await self.holidays.remaining(today)
+        if not remaining_holidays:
+            return [f"No more holidays left for {today.year}."], False
+        
+        lines = [f"Remaining holidays for {today.year}:", ""]
+        lines.extend(f"📅 {h['date']}: {h['name']}" for h in remaining_holidays)
+        return split_message(lines), True
+
     async def check_notifications(self):
-        while True:
-            try:
-                now = datetime.now()
-                target_time = time(hour=6, minute=0)  # 6:00 AM
-                
-                # Calculate time until next 6 AM
-                if now.time() > target_time:
-                    next_run = now + timedelta(days=1)
-                else:
-                    next_run = now
-                next_run = next_run.replace(hour=6, minute=0, second=0, microsecond=0)
-                
-                # Sleep until 6 AM
-                sleep_seconds = (next_run - now).total_seconds()
-                await asyncio.sleep(sleep_seconds)
-                
-                today = next_run.date()
-                tomorrow = today + timedelta(days=1)
-                
-                for user_id, user_reminders in self.reminders.items():
-                    updated_reminders = []
-                    for reminder in user_reminders:
-                        reminder_date = datetime.strptime(reminder['date'], '%Y-%m-%d').date()
-                        
-                        if reminder_date < today:
-                            # Skip past reminders (they will be removed)
-                            continue
-                        
-                        if reminder_date == today or reminder_date == tomorrow:
-                            # Send notification for today's and tomorrow's reminders
-                            message = f"⏰ Reminder for {'today' if reminder_date == today else 'tomorrow'}: {reminder['description']}"
-                            try:
-                                await self.application.bot.send_message(chat_id=user_id, text=message)
-                                logger.info(f"Sent reminder notification to user {user_id}")
-                            except Exception as e:
-                                logger.error(f"Failed to send reminder to user {user_id}: {str(e)}")
-                        
-                        updated_reminders.append(reminder)
-                    
-                    # Update user's reminders, removing past ones
-                    self.reminders[user_id] = updated_reminders
-                
-            except Exception as e:
-                logger.error(f"Error in check_notifications: {str(e)}")
-                await asyncio.sleep(60)  # Wait for 1 minute before retrying if there's an error
+        await self.scheduler.run()
 
-    async def send_holiday_notification(self, holiday, is_today):
-        message = f"🎉 {'Today' if is_today else 'Tomorrow'} is {holiday['name']}!"
-        for user_id in self.reminders.keys():
-            try:
-                await self.application.bot.send_message(chat_id=user_id, text=message)
-            except Exception as e:
-                logger.error(f"Failed to send holiday notification to user {user_id}: {e}")
+    @staticmethod
+    def format_when(reminder):
+        return f"{reminder.date_str} {reminder.time_str}" if reminder.minute >= 0 else reminder.date_str
+
+    async def local_now(self, user_id):
+        name = (await self.store.get_timezones([user_id]))[user_id]
+        return datetime.now(resolve_timezone(name, self.default_timezone))
 
-    async def send_reminder_notification(self, user_id, reminder, is_today):
-        message = f"⏰ {'Reminder for today' if is_today else 'Reminder for tomorrow'}: {reminder['description']}"
+    async def set_timezone(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = str(update.effective_user.id)
+        if not context.args:
+            current = (await self.store.get_timezones([user_id]))[user_id] or "server default"
+            await update.message.reply_text(
+                f"Your timezone is {current}.\n"
+                "Set it with /timezone Area/City, for example /timezone Asia/Phnom_Penh"
+            )
+            return
+
+        name = context.args[0]
         try:
-            await self.application.bot.send_message(chat_id=user_id, text=message)
-        except Exception as e:
-            logger.error(f"Failed to send reminder notification to user {user_id}: {e}")
+            ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            await update.message.reply_text(f"Unknown timezone: {name}. Use a name like Asia/Phnom_Penh.")
+            return
+
+        await self.store.set_timezone(user_id, name)
+        if self.scheduler:
+            await self.scheduler.reschedule_user(user_id)
+        await update.message.reply_text(f"Timezone set to {name}. Reminders will follow your local time.")
 
     async def delete_reminder(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        logger.info("Delete reminder method called")
+        logger.info("Delete reminder method called", extra=PER_REQUEST)
         query = update.callback_query
-        await query.answer()
         
         user_id = str(update.effective_user.id)
-        if user_id not in self.reminders or not self.reminders[user_id]:
-            await query.edit_message_text("You have no reminders to delete.")
+        after = await self.page_cursor(user_id, query.data)
+        reminders, has_more = await self.store.page(user_id, after, self.page_size)
+        if not reminders:
+            await query.edit_message_text(
+                "You have no reminders to delete.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Back to Main Menu", callback_data='start')]])
+            )
             return
         
+        # Buttons carry the reminder ID, which never changes, rather than a list position
         keyboard = []
-        for i, reminder in enumerate(self.reminders[user_id]):
-            callback_data = f"delete_{i}"
-            button_text = f"{reminder['date']}: {reminder['description'][:20]}..."
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
+        for reminder in reminders:
+            button_text = f"{self.format_when(reminder)}: {reminder.description[:20]}..."
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"delete_id:{reminder.id}")])
         
+        keyboard.extend(self.page_buttons('delete_page', query.data, reminders, has_more))
         keyboard.append([InlineKeyboardButton("Cancel", callback_data='cancel_delete')])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -362,94 +2467,202 @@ class CalendarBot:
 
     async def handle_delete_reminder(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
-        await query.answer()
         
         user_id = str(update.effective_user.id)
-        reminder_index = int(query.data.split('_')[1])
+        reminder_id = int(query.data.split(':')[1])
         
-        if user_id in self.reminders and 0 <= reminder_index < len(self.reminders[user_id]):
-            deleted_reminder = self.reminders[user_id].pop(reminder_index)
-            await query.edit_message_text(f"Deleted reminder: {deleted_reminder['date']}: {deleted_reminder['description']}")
+        removed = await self.store.remove(user_id, [reminder_id])
+        if removed:
+            deleted_reminder = removed[0]
+            await query.edit_message_text(f"Deleted reminder: {self.format_when(deleted_reminder)}: {deleted_reminder.description}")
         else:
-            await query.edit_message_text("Failed to delete reminder. Please try again.")
+            await query.edit_message_text("That reminder no longer exists. It may have been deleted or expired.")
 
         # Add a button to go back to the main menu
         keyboard = [[InlineKeyboardButton("Back to Main Menu", callback_data='start')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.message.reply_text("What would you like to do next?", reply_markup=reply_markup)
 
+    def build_application(self):
+        builder = Application.builder().token(self.token)
+        if os.getenv('TELEGRAM_API_BASE_URL'):
+            # Lets the local harness point the bot at a fake Bot API server
+            builder = builder.base_url(os.getenv('TELEGRAM_API_BASE_URL'))
+        # Users are served in parallel; each user's updates still run one at a time
+        # under that user's lock, so handlers never race on the user's reminders
+        concurrent_updates = int(os.getenv('CONCURRENT_UPDATES', '16'))
+        if concurrent_updates > 1:
+            builder = builder.concurrent_updates(PerUserUpdateProcessor(concurrent_updates))
+        return builder.build()
+
+    async def start_webhook(self):
+        self.webhook_server = LocalHttpServer(
+            {('POST', self.webhook_path): self.handle_webhook},
+            host=self.webhook_listen,
+            port=int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')))
+        )
+        await self.webhook_server.start()
+        if os.getenv('WEBHOOK_URL'):
+            await self.application.bot.set_webhook(
+                url=os.getenv('WEBHOOK_URL'),
+                secret_token=self.webhook_secret,
+                max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+            )
+            logger.info(f"Webhook registered at {os.getenv('WEBHOOK_URL')}")
+
+    async def handle_metrics(self, request):
+        return 200, 'text/plain; version=0.0.4; charset=utf-8', metrics.render().encode('utf-8')
+
+    async def handle_webhook(self, request):
+        if not has_webhook_secret(request, self.webhook_secret):
+            return 403, 'text/plain', b'Forbidden'
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return 400, 'text/plain', b'Bad Request'
+        # Acknowledge right away; the application works through its update queue
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+        return 200, 'text/plain', b'OK'
+
     async def run(self):
-        self.application = Application.builder().token(self.token).build()
+        self.application = self.build_application()
+        self.sender = NotificationSender(
+            self.application.bot,
+            concurrency=int(os.getenv('NOTIFY_CONCURRENCY', '20')),
+            global_rate=float(os.getenv('NOTIFY_RATE_LIMIT', '30'))
+        )
+        self.scheduler = NotificationScheduler(
+            self.store, self.sender, self.shard,
+            lease=self.notifier_lease,
+            default_timezone=self.default_timezone,
+            notify_time=datetime.strptime(os.getenv('NOTIFY_TIME', '06:00'), '%H:%M').time(),
+            holidays=self.holidays
+        )
         self.setup_handlers()
+        self.stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, self.stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # No signal handlers outside the main thread or on Windows
+        await self.store.open()
+        await self.holidays.open()
         
         # Start the bot
         await self.application.initialize()
         await self.application.start()
-        await self.application.updater.start_polling()
+        if self.mode == 'webhook':
+            await self.start_webhook()
+        else:
+            await self.application.updater.start_polling()
+        
+        if os.getenv('METRICS_PORT'):
+            self.metrics_server = LocalHttpServer(
+                {('GET', '/metrics'): self.handle_metrics},
+                host=os.getenv('METRICS_LISTEN', '127.0.0.1'),
+                port=int(os.getenv('METRICS_PORT'))
+            )
+            await self.metrics_server.start()
         
         # Start the notification check loop after bot is initialized
         self.notification_task = asyncio.create_task(self.check_notifications())
+        self.holiday_refresh_task = asyncio.create_task(self.holidays.refresh_loop())
+        self.loop_monitor_task = asyncio.create_task(metrics.watch_event_loop())
         
         # Run the bot until it's stopped
         try:
-            # Use asyncio.Event to keep the coroutine running
-            stop_signal = asyncio.Event()
-            await stop_signal.wait()
+            await self.stop_event.wait()
+            logger.info("Signal received. Shutting down...")
         finally:
-            await self.application.stop()
+            await self.shutdown()
 
     async def stop(self):
+        # Makes run() shut down gracefully
+        if self.stop_event:
+            self.stop_event.set()
+
+    async def shutdown(self):
+        # Stops taking updates, then gives in-flight handlers and the notification
+        # pass in progress until shutdown_timeout to finish. A pass still sending by
+        # then stops after the sends in flight and checkpoints what was delivered,
+        # so the next run picks up where it left off.
+        deadline = monotonic() + self.shutdown_timeout
         try:
-            print("Stopping bot...")
-            self.notification_task.cancel()
-            self.stop_signal.set()  # Signal the bot to stop
-            await self.application.stop()
-            await self.application.shutdown()
+            if self.webhook_server:
+                await self.webhook_server.stop()
+            elif self.application.updater and self.application.updater.running:
+                await self.application.updater.stop()
+
+            self.scheduler.stop()
+            draining = {asyncio.ensure_future(self.application.stop())}
+            if self.notification_task:
+                draining.add(self.notification_task)
+            _, pending = await asyncio.wait(draining, timeout=max(deadline - monotonic(), 0))
+            if self.notification_task in pending:
+                logger.warning("Notification pass still sending at the shutdown deadline, stopping it")
+                self.sender.stop()
+                _, pending = await asyncio.wait(draining, timeout=5)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*draining, return_exceptions=True)
+
+            for task in (self.holiday_refresh_task, self.loop_monitor_task):
+                if task:
+                    task.cancel()
+            if self.metrics_server:
+                await self.metrics_server.stop()
+            if self.notifier_lease:
+                await self.notifier_lease.release()  # Lets a standby take over right away
+            if not self.application.running:
+                await self.application.shutdown()
         except Exception as e:
-            print(f"Error during shutdown: {e}")
+            logger.error(f"Error during shutdown: {str(e)}")
             traceback.print_exc()
+        finally:
+            await self.store.close()
+            self.holidays.close()
+
+    @staticmethod
+    def timed(name, callback):
+        # Records the handler's latency under bot_handler_seconds{handler=name}
+        @functools.wraps(callback)
+        async def handler(update, context):
+            with metrics.timer('bot_handler_seconds', handler=name):
+                return await callback(update, context)
+        return handler
 
     def setup_handlers(self):
         logger.info("Setting up handlers")
-        start_handler = CommandHandler('start', self.start)
+        start_handler = CommandHandler('start', self.timed('start', self.start))
         self.application.add_handler(start_handler)
+        self.application.add_handler(CommandHandler('timezone', self.timed('timezone', self.set_timezone)))
+        self.application.add_handler(CommandHandler('export', self.timed('export', self.export_reminders)))
 
-        # Add a general callback query handler
+        # Every callback query goes through handle_callback's routing table
         self.application.add_handler(CallbackQueryHandler(self.handle_callback))
 
         # Add a message handler for adding reminders
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.save_reminder))
-
-        # Add handler for deleting reminders
-        self.application.add_handler(CallbackQueryHandler(self.delete_reminder, pattern='^delete_reminder$'))
-        self.application.add_handler(CallbackQueryHandler(self.handle_delete_reminder, pattern='^delete_\d+$'))
-        self.application.add_handler(CallbackQueryHandler(self.start, pattern='^cancel_delete$'))
+        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.timed('save_reminder', self.save_reminder)))
+        self.application.add_handler(MessageHandler(filters.Document.ALL, self.timed('import_document', self.import_document)))
 
         logger.info("Handlers set up successfully")
 
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
-        logger.info(f"Received callback query with data: {query.data}")
+        logger.info(f"Received callback query with data: {query.data}", extra=PER_REQUEST)
 
+        # Every query is answered here, once, so the route handlers never do
         await query.answer()
 
-        if query.data == 'add_reminder':
-            await self.add_reminder(update, context)
-        elif query.data == 'list_reminders':
-            await self.list_reminders(update, context)
-        elif query.data == 'list_holidays':
-            await self.list_holidays(update, context)
-        elif query.data == 'delete_reminder':
-            await self.delete_reminder(update, context)
-        elif query.data.startswith('delete_'):
-            await self.handle_delete_reminder(update, context)
-        elif query.data == 'start':
-            await self.start(update, context)
-        elif query.data == 'cancel_delete':
-            await self.start(update, context)
-        else:
-            logger.warning(f"Unknown callback query data: {query.data}")
-            await query.edit_message_text("Sorry, I didn't understand that command.")
+        route = query.data.split(':', 1)[0]
+        handler = self.callback_routes.get(route)
+        with metrics.timer('bot_handler_seconds', handler=route if handler else 'unknown'):
+            if handler is None:
+                logger.warning(f"Unknown callback query data: {query.data}")
+                await query.edit_message_text("Sorry, I didn't understand that command.")
+                return
+            await handler(update, context)
 
 if __name__ == '__main__':
     try:
@@ -460,8 +2673,16 @@ if __name__ == '__main__':
         if not BOT_TOKEN:
             raise ValueError("BOT_TOKEN environment variable is not set")
 
-        bot = CalendarBot()
-        asyncio.run(bot.run())
+        parser = argparse.ArgumentParser(description="Calendar Notification Bot")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="run this many sharded webhook workers behind a local router")
+        args = parser.parse_args()
+
+        if args.workers > 1:
+            asyncio.run(run_sharded(args.workers))
+        else:
+            bot = CalendarBot()
+            asyncio.run(bot.run())
     except Exception as e:
         logger.error(f"Bot crashed: {str(e)}", exc_info=True)
         sys.exit(1)
\ No newline at end of file
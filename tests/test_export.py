@@ -0,0 +1,68 @@
+import asyncio
+import json
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from telegram import Bot, Update
+from telegram.request import BaseRequest
+
+from calendar_reminder import CalendarBot
+from webhook_harness import make_update
+
+# Bot warns that the upload write_timeout default will change; irrelevant to a fake request
+pytestmark = pytest.mark.filterwarnings('ignore::telegram.warnings.PTBDeprecationWarning')
+
+class RecordingRequest(BaseRequest):
+    # Answers every Bot API call with a minimal message and keeps what was posted
+    def __init__(self):
+        self.posts = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        self.posts.append((url.rsplit('/', 1)[-1], request_data))
+        message = {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'}}
+        return 200, json.dumps({'ok': True, 'result': message}).encode('utf-8')
+
+def export(monkeypatch, tmp_path, kind):
+    monkeypatch.setenv('BOT_TOKEN', '123456:TEST')
+    monkeypatch.setenv('REMINDER_STORE', 'memory')
+    monkeypatch.setenv('HOLIDAY_CACHE_PATH', str(tmp_path / 'holidays.json'))
+
+    async def run():
+        calendar_bot = CalendarBot()
+        await calendar_bot.store.open()
+        try:
+            ordinal = date(2030, 1, 1).toordinal()
+            await calendar_bot.store.add('1', 'New year', ordinal)
+            await calendar_bot.store.add('1', 'Dentist, downtown', ordinal + 1, 9 * 60 + 30)
+            request = RecordingRequest()
+            bot = Bot('123456:TEST', request=request)
+            update = Update.de_json(make_update(1, 1, 'message', f"/export {kind}"), bot)
+            await calendar_bot.export_reminders(update, SimpleNamespace(args=[kind], user_data={}))
+        finally:
+            await calendar_bot.store.close()
+            calendar_bot.holidays.close()
+        return request.posts
+
+    posts = asyncio.run(run())
+    assert [method for method, _ in posts] == ['sendDocument']
+    filename, content, _ = posts[0][1].multipart_data['document']
+    assert filename == f"reminders.{kind}"
+    return content.decode('utf-8')
+
+def test_export_csv(monkeypatch, tmp_path):
+    content = export(monkeypatch, tmp_path, 'csv')
+    assert 'New year,2030-01-01' in content
+    assert '"Dentist, downtown",2030-01-02,09:30' in content
+
+def test_export_ics(monkeypatch, tmp_path):
+    content = export(monkeypatch, tmp_path, 'ics')
+    assert content.startswith('BEGIN:VCALENDAR\r\n')
+    assert 'SUMMARY:New year\r\n' in content
+    assert 'SUMMARY:Dentist\\, downtown\r\n' in content
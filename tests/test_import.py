@@ -0,0 +1,173 @@
+import asyncio
+import csv
+import io
+from datetime import date
+from zoneinfo import ZoneInfo
+
+from calendar_reminder import (
+    CalendarBot, csv_export_rows, ics_export_lines, iter_csv_reminders, iter_ics_reminders, iter_text_reminders
+)
+
+DAY = date(2030, 1, 1).toordinal()
+BERLIN = ZoneInfo('Europe/Berlin')
+
+def test_text_reminders():
+    lines = [
+        'New year, 2030-01-01\n',
+        '\n',
+        'Dentist, downtown, 2030-01-02 09:30\n',
+        'No date at all\n',
+        'Bad date, 2030-02-30\n',
+        ', 2030-01-01\n',
+    ]
+    assert list(iter_text_reminders(lines)) == [
+        (1, ('New year', DAY, -1)),
+        (3, ('Dentist, downtown', DAY + 1, 9 * 60 + 30)),
+        (4, None),
+        (5, None),
+        (6, None),
+    ]
+
+def test_csv_reminders_without_header():
+    lines = io.StringIO('New year,2030-01-01\r\n"Dentist, downtown",2030-01-02,09:30\r\n,,\r\nLunch,2030-01-03,\r\n')
+    assert list(iter_csv_reminders(lines)) == [
+        (1, ('New year', DAY, -1)),
+        (2, ('Dentist, downtown', DAY + 1, 9 * 60 + 30)),
+        (4, ('Lunch', DAY + 2, -1)),
+    ]
+
+def test_csv_header_reorders_columns():
+    lines = io.StringIO('Time,Date,Description\n12:00,2030-01-01,Lunch\n,2030-01-02,All day\n')
+    assert list(iter_csv_reminders(lines)) == [
+        (2, ('Lunch', DAY, 12 * 60)),
+        (3, ('All day', DAY + 1, -1)),
+    ]
+    # Without a time column every row is all-day, and extra columns are ignored
+    lines = io.StringIO('notes,date,description\nbring cake,2030-01-01,Birthday\n')
+    assert list(iter_csv_reminders(lines)) == [(2, ('Birthday', DAY, -1))]
+
+def test_csv_bad_rows_are_reported_by_line():
+    lines = io.StringIO(
+        'description,date,time\n'
+        'Short row\n'
+        'Bad date,2030-13-01\n'
+        'Bad time,2030-01-01,25:00\n'
+        ',2030-01-01\n'
+        'Fine,2030-01-01\n'
+    )
+    assert list(iter_csv_reminders(lines)) == [
+        (2, None), (3, None), (4, None), (5, None), (6, ('Fine', DAY, -1))
+    ]
+
+def test_ics_folding_and_escapes():
+    lines = io.StringIO(
+        'BEGIN:VCALENDAR\r\n'
+        'SUMMARY:Outside any event\r\n'
+        'BEGIN:VEVENT\r\n'
+        'DTSTART;VALUE=DATE:20300101\r\n'
+        'SUMMARY:Dentist\\, downtown\\; bring\r\n'
+        '  \\\\ card\\nand\r\n'  # Unfolding drops only the first space
+        '\tcake\r\n'
+        'END:VEVENT\r\n'
+        'END:VCALENDAR\r\n',
+        newline=''
+    )
+    assert list(iter_ics_reminders(lines)) == [(3, ('Dentist, downtown; bring \\ card\nandcake', DAY, -1))]
+
+def test_ics_times_convert_to_the_users_timezone():
+    def event(start):
+        return f'BEGIN:VEVENT\nSUMMARY:Call\n{start}\nEND:VEVENT\n'
+    lines = io.StringIO(
+        event('DTSTART:20300101T080000Z')
+        + event('DTSTART;TZID=America/New_York:20300101T080000')
+        + event('DTSTART;TZID="Europe/Berlin":20300101T080000')
+        + event('DTSTART:20300101T080000')  # Floating: taken as it is
+    )
+    assert [entry for _, entry in iter_ics_reminders(lines, BERLIN)] == [
+        ('Call', DAY, 9 * 60),
+        ('Call', DAY, 14 * 60),
+        ('Call', DAY, 8 * 60),
+        ('Call', DAY, 8 * 60),
+    ]
+
+def test_ics_events_missing_fields_are_skipped():
+    lines = io.StringIO(
+        'BEGIN:VEVENT\nSUMMARY:No start\nEND:VEVENT\n'
+        'BEGIN:VEVENT\nDTSTART:20300101T080000\nEND:VEVENT\n'
+        'BEGIN:VEVENT\nSUMMARY:Bad start\nDTSTART:2030-01-01\nEND:VEVENT\n'
+    )
+    assert list(iter_ics_reminders(lines)) == [(1, None), (4, None), (7, None)]
+
+def calendar_bot(monkeypatch, tmp_path):
+    monkeypatch.setenv('BOT_TOKEN', '123456:TEST')
+    monkeypatch.setenv('REMINDER_STORE', 'memory')
+    monkeypatch.setenv('HOLIDAY_CACHE_PATH', str(tmp_path / 'holidays.json'))
+    return CalendarBot()
+
+def run_with_store(bot, steps):
+    async def run():
+        await bot.store.open()
+        try:
+            return await steps()
+        finally:
+            await bot.store.close()
+            bot.holidays.close()
+    return asyncio.run(run())
+
+def entries(reminders):
+    return [(r.description, r.ordinal, r.minute) for r in reminders]
+
+def test_import_reminders_batches_and_counts_skipped(monkeypatch, tmp_path):
+    bot = calendar_bot(monkeypatch, tmp_path)
+    bot.import_batch_size = 2
+    parsed = [(number, ('Entry', DAY + number, -1)) for number in range(1, 6)]
+    parsed += [(number, None) for number in range(6, 18)]
+
+    async def steps():
+        result = await bot.import_reminders('1', iter(parsed))
+        return result, await bot.store.get_user('1')
+
+    (imported, skipped), reminders = run_with_store(bot, steps)
+    assert imported == 5
+    assert skipped == (12, list(range(6, 16)))
+    assert entries(reminders) == [entry for _, entry in parsed[:5]]
+    assert bot.import_summary(imported, skipped) == (
+        "Imported 5 reminders.\nSkipped 12 lines that could not be read: 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, ..."
+    )
+
+ROUND_TRIP = [
+    ('New year', DAY, -1),
+    ('Dentist, downtown; "room 4"', DAY + 1, 9 * 60 + 30),
+    ('Backslash \\ and a long description ' + 'é' * 60, DAY + 2, 23 * 60 + 59),
+    ('Midnight', DAY + 3, 0),
+]
+
+def round_trip(monkeypatch, tmp_path, export, parse):
+    bot = calendar_bot(monkeypatch, tmp_path)
+
+    async def steps():
+        await bot.store.set_timezone('1', 'Europe/Berlin')
+        await bot.store.add_many('1', ROUND_TRIP)
+        buffer = io.StringIO(newline='')
+        export(buffer, await bot.store.get_user('1'))
+        buffer.seek(0)
+        result = await bot.import_reminders('2', parse(buffer))
+        return result, await bot.store.get_user('1'), await bot.store.get_user('2')
+
+    (imported, skipped), exported, reimported = run_with_store(bot, steps)
+    assert imported == len(ROUND_TRIP) and skipped == (0, [])
+    assert entries(reimported) == entries(exported)
+
+def test_csv_export_imports_back(monkeypatch, tmp_path):
+    round_trip(
+        monkeypatch, tmp_path,
+        lambda buffer, reminders: csv.writer(buffer).writerows(csv_export_rows(reminders)),
+        iter_csv_reminders
+    )
+
+def test_ics_export_imports_back(monkeypatch, tmp_path):
+    round_trip(
+        monkeypatch, tmp_path,
+        lambda buffer, reminders: buffer.writelines(ics_export_lines(reminders, 'Europe/Berlin')),
+        lambda buffer: iter_ics_reminders(buffer, BERLIN)
+    )
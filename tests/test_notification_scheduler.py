@@ -0,0 +1,61 @@
+import asyncio
+import collections
+from datetime import date, timedelta
+
+from calendar_reminder import MemoryReminderStore, NotificationScheduler, NotificationSender, ShardConfig
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = collections.Counter()
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(0.001)
+        self.sent[chat_id] += 1
+
+def test_interrupted_first_pass_resumes_without_watermark(monkeypatch):
+    # No watermark is stored yet, so the checkpoint alone says where the pass started
+    clock = [NotificationScheduler.now()]
+    monkeypatch.setattr(NotificationScheduler, 'now', staticmethod(lambda: clock[0]))
+    now = clock[0]
+
+    async def run():
+        store = MemoryReminderStore()
+        await store.open()
+        tomorrow = (date.today() + timedelta(days=1)).toordinal()
+        for user in range(50):
+            await store.add(str(user), f"Reminder {user}", tomorrow)
+        bot = RecordingBot()
+
+        def scheduler():
+            sender = NotificationSender(bot, concurrency=5, global_rate=10 ** 9, per_chat_rate=10 ** 9)
+            return sender, NotificationScheduler(store, sender, ShardConfig(), horizon=48 * 60 * 60,
+                                                 catch_up=72 * 60 * 60)
+
+        sender, first = scheduler()
+        first._fired_until = now - 1
+        await first._plan(now - 1, now + first.horizon)
+        sending = asyncio.ensure_future(first._fire_due(now + first.horizon))
+        while not bot.sent:
+            await asyncio.sleep(0)
+        sender.stop()
+        await sending
+        assert 0 < len(bot.sent) < 50
+        assert await store.get_meta(first.watermark_key) is None
+
+        # The restart comes after the end of the interrupted pass
+        clock[0] = now + first.horizon + 60
+        _, second = scheduler()
+        second._wakeup = asyncio.Event()
+        running = asyncio.ensure_future(second._run())
+        for _ in range(500):
+            if not await store.get_meta(second.checkpoint_key):
+                break
+            await asyncio.sleep(0.01)
+        second.stop()
+        await running
+        await store.close()
+        return bot.sent
+
+    sent = asyncio.run(run())
+    assert sorted(sent) == sorted(str(user) for user in range(50))
+    assert set(sent.values()) == {1}
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+import calendar_reminder
+from calendar_reminder import NotificationSender
+
+class ScriptedBot:
+    # Raises the scripted errors for a chat in order, then sends; records the
+    # sender's clock at every attempt
+    def __init__(self, errors=None):
+        self.errors = {chat_id: list(script) for chat_id, script in (errors or {}).items()}
+        self.attempts = []
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.attempts.append((chat_id, calendar_reminder.monotonic()))
+        script = self.errors.get(chat_id)
+        if script:
+            raise script.pop(0)
+        self.sent.append((chat_id, text))
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Sleeps advance a fake clock instead of waiting. Concurrent sleepers all advance
+    # the one clock, so timings are exact only with a single worker
+    clock = [1000.0]
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        clock[0] += delay
+        await real_sleep(0)
+
+    monkeypatch.setattr(calendar_reminder, 'monotonic', lambda: clock[0])
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    return clock
+
+def send(bot, messages, **kwargs):
+    kwargs.setdefault('global_rate', 10 ** 6)
+    sender = NotificationSender(bot, **kwargs)
+    return asyncio.run(sender.send_all(messages))
+
+def test_retry_after_pauses_every_worker(clock):
+    bot = ScriptedBot({1: [RetryAfter(5)]})
+    report = send(bot, [(1, 'a'), (2, 'b'), (3, 'c')], concurrency=1)
+
+    assert report['sent'] == 3 and report['failed'] == 0 and report['retried'] == 1
+    assert [chat_id for chat_id, _ in bot.attempts] == [1, 1, 2, 3]
+    first_failure = bot.attempts[0][1]
+    assert bot.attempts[1][1] == first_failure + 5
+    assert all(at >= first_failure + 5 for _, at in bot.attempts[1:])
+
+def test_retry_after_holds_back_other_chats():
+    # Real time: one worker's flood error pauses the workers sending to other chats
+    bot = ScriptedBot({1: [RetryAfter(0.2)]})
+    report = send(bot, [(1, 'a')] + [(chat_id, 'b') for chat_id in range(2, 12)],
+                  concurrency=2, per_chat_rate=10 ** 6)
+
+    assert report['sent'] == 11 and report['retried'] == 1
+    first_chat, first_failure = bot.attempts[0]
+    assert first_chat == 1
+    assert all(at >= first_failure + 0.2 for _, at in bot.attempts[1:])
+
+def test_network_errors_back_off_exponentially(clock):
+    bot = ScriptedBot({1: [NetworkError('reset'), NetworkError('reset')]})
+    report = send(bot, [(1, 'a')], max_retries=3)
+
+    assert report['sent'] == 1 and report['failed'] == 0 and report['retried'] == 2
+    assert len(bot.attempts) == 3
+    assert [b - a for (_, a), (_, b) in zip(bot.attempts, bot.attempts[1:])] == [1, 2]
+
+def test_gives_up_after_max_retries(clock):
+    bot = ScriptedBot({1: [NetworkError('down')] * 10})
+    report = send(bot, [(1, 'a'), (2, 'b')], max_retries=2, concurrency=1)
+
+    assert report['sent'] == 1 and report['failed'] == 1 and report['retried'] == 2
+    assert [chat_id for chat_id, _ in bot.attempts] == [1, 1, 1, 2]
+    # No backoff after the last attempt: the next message goes out straight away
+    assert bot.attempts[3][1] == bot.attempts[2][1]
+
+def test_other_errors_are_not_retried(clock):
+    bot = ScriptedBot({1: [BadRequest('Chat not found')]})
+    report = send(bot, [(1, 'a'), (2, 'b')])
+
+    assert report['sent'] == 1 and report['failed'] == 1 and report['retried'] == 0
+    assert len(bot.attempts) == 2
+
+def test_per_chat_rate_spaces_one_chat_without_holding_back_others():
+    # Real time, since the workers sleep concurrently
+    bot = ScriptedBot()
+    messages = [(1, 'a'), (1, 'b'), (1, 'c'), (2, 'd'), (2, 'e')]
+    report = send(bot, messages, concurrency=5, per_chat_rate=20)
+
+    assert report['sent'] == 5
+    times = {chat_id: [at for c, at in bot.attempts if c == chat_id] for chat_id in (1, 2)}
+    for chat_times in times.values():
+        assert all(b - a >= 0.04 for a, b in zip(chat_times, chat_times[1:]))
+    # Chat 2 doesn't queue behind chat 1's backlog
+    assert times[2][0] < times[1][1]
@@ -0,0 +1,183 @@
+import asyncio
+from datetime import date
+
+from calendar_reminder import LogReminderStore, MemoryReminderStore, Reminder, SQLiteReminderStore
+
+DAY = date(2030, 1, 1).toordinal()
+
+# All-day (-1) and timed reminders on the same dates, added out of order so IDs
+# don't follow the sort order
+ENTRIES = [
+    ('Lunch', DAY, 12 * 60),
+    ('Holiday', DAY, -1),
+    ('Midnight', DAY, 0),
+    ('Birthday', DAY, -1),
+    ('Late', DAY, 23 * 60 + 59),
+    ('Next morning', DAY + 1, 9 * 60),
+    ('Next day', DAY + 1, -1),
+]
+
+async def walk(store, user_id, limit):
+    # Pages through the user's reminders the way the list menu does
+    pages, after = [], Reminder.probe(DAY)
+    for _ in range(len(ENTRIES) + 1):
+        reminders, has_more = await store.page(user_id, after, limit)
+        pages.append(([(r.id, r.ordinal, r.minute, r.description) for r in reminders], has_more))
+        if not has_more or not reminders:
+            break
+        after = reminders[-1]
+    return pages
+
+async def add_entries(store):
+    for description, ordinal, minute in ENTRIES:
+        await store.add('1', description, ordinal, minute)
+
+def test_sqlite_paging_matches_memory_order(tmp_path):
+    async def run():
+        memory = MemoryReminderStore()
+        await memory.open()
+        await add_entries(memory)
+        expected = [await walk(memory, '1', limit) for limit in (1, 2, 3, 10)]
+
+        path = str(tmp_path / 'reminders.db')
+        store = SQLiteReminderStore(path)
+        await store.open()
+        await add_entries(store)
+        await store.close()
+
+        # A fresh store pages through SQL, then through memory once the user is loaded
+        store = SQLiteReminderStore(path)
+        await store.open()
+        try:
+            from_sql = [await walk(store, '1', limit) for limit in (1, 2, 3, 10)]
+            await store.get_user('1')
+            from_memory = [await walk(store, '1', limit) for limit in (1, 2, 3, 10)]
+        finally:
+            await store.close()
+        await memory.close()
+        return expected, from_sql, from_memory
+
+    expected, from_sql, from_memory = asyncio.run(run())
+    assert [r[3] for page, _ in expected[-1] for r in page] == [
+        'Holiday', 'Birthday', 'Midnight', 'Lunch', 'Late', 'Next day', 'Next morning'
+    ]
+    assert from_sql == expected
+    assert from_memory == expected
+
+async def contents(store):
+    # Everything a reopened store should get back, in comparable form
+    users = {}
+    for user_id in sorted(await store.user_ids()):
+        users[user_id] = [(r.id, r.ordinal, r.minute, r.description) for r in await store.get_user(user_id)]
+    return users, await store.get_timezones(sorted(users)), await store.get_meta('checkpoint')
+
+async def reopen(path, **kwargs):
+    store = LogReminderStore(path, **kwargs)
+    await store.open()
+    return store
+
+async def fill(store):
+    await add_entries(store)
+    await store.add_many('2', [('Standup', DAY, 9 * 60), ('Retro', DAY + 1, 15 * 60)])
+    removed = await store.remove('1', [r.id for r in await store.get_user('1') if r.description == 'Lunch'])
+    assert len(removed) == 1
+    await store.set_timezone('2', 'Europe/Berlin')
+    await store.set_meta('checkpoint', {'until': 1})
+    await store.expire_before(DAY + 1)
+    await store.add('1', 'Later', DAY + 2, -1)
+
+def test_log_store_replays_after_restart(tmp_path):
+    async def run():
+        path = str(tmp_path / 'reminders.log')
+        store = await reopen(path)
+        await fill(store)
+        expected = await contents(store)
+        await store.close()
+
+        store = await reopen(path)
+        try:
+            return expected, await contents(store)
+        finally:
+            await store.close()
+
+    expected, replayed = asyncio.run(run())
+    assert [r[3] for r in expected[0]['1']] == ['Next day', 'Next morning', 'Later']
+    assert [r[3] for r in expected[0]['2']] == ['Retro']
+    assert expected[1] == {'1': None, '2': 'Europe/Berlin'}
+    assert replayed == expected
+
+def test_log_store_compaction_keeps_state_and_ids(tmp_path):
+    async def run():
+        path = str(tmp_path / 'reminders.log')
+        store = await reopen(path, compact_every=4)
+        await fill(store)
+        await store.flush()
+        expected = await contents(store)
+        await store.close()
+
+        store = await reopen(path, compact_every=4)
+        try:
+            replayed = await contents(store)
+            # The newest reminder is deleted before compaction; its ID must not come back
+            newest = max(r[0] for rows in replayed[0].values() for r in rows)
+            await store.remove('1', [newest])
+            await store.set_meta('checkpoint', None)  # Flushes, and compacts at this size
+            await store.close()
+            store = await reopen(path, compact_every=4)
+            added = await store.add('3', 'After compaction', DAY + 3)
+        finally:
+            await store.close()
+        return expected, replayed, newest, added
+
+    expected, replayed, newest, added = asyncio.run(run())
+    assert (tmp_path / 'reminders.log.snapshot').exists()
+    assert replayed == expected
+    assert added.id == newest + 1
+
+def test_log_store_cuts_torn_record_and_keeps_later_writes(tmp_path):
+    async def run():
+        path = str(tmp_path / 'reminders.log')
+        store = await reopen(path)
+        await add_entries(store)
+        expected = await contents(store)
+        await store.close()
+
+        with open(path, 'rb') as f:
+            lines = f.read().splitlines(keepends=True)
+        with open(path, 'ab') as f:
+            f.write(lines[0])  # A retried batch written twice
+            f.write(b'{"op": "add", "user_id": "1", "rem')  # Cut off by a crash
+
+        store = await reopen(path)
+        after_crash = await contents(store)
+        added = await store.add('1', 'After crash', DAY + 2)
+        await store.close()
+
+        store = await reopen(path)
+        try:
+            return expected, after_crash, added, await contents(store)
+        finally:
+            await store.close()
+
+    expected, after_crash, added, replayed = asyncio.run(run())
+    assert after_crash == expected
+    assert replayed[0]['1'] == expected[0]['1'] + [(added.id, DAY + 2, -1, 'After crash')]
+
+def test_log_store_drops_records_that_cannot_be_written(tmp_path):
+    async def run():
+        path = str(tmp_path / 'reminders.log')
+        store = await reopen(path)
+        first = await store.add('1', 'Before', DAY)
+        await store.set_meta('checkpoint', object())  # Not JSON: fails on every attempt
+        second = await store.add('1', 'After', DAY + 1)
+        await store.close()
+
+        store = await reopen(path)
+        try:
+            return first, second, await contents(store)
+        finally:
+            await store.close()
+
+    first, second, (users, _, checkpoint) = asyncio.run(run())
+    assert users == {'1': [(first.id, DAY, -1, 'Before'), (second.id, DAY + 1, -1, 'After')]}
+    assert checkpoint is None
@@ -0,0 +1,193 @@
+"""Local throughput harness for webhook mode.
+
+Starts a fake Telegram Bot API server and the bot in webhook mode pointed at it,
+posts synthetic updates to the webhook and prints throughput as JSON. Needs no
+network access and no real token:
+
+    python3 webhook_harness.py --users 500 --concurrent-updates 64 --api-latency 0.05
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import sys
+from time import monotonic, time
+from urllib.parse import parse_qs
+
+from calendar_reminder import CalendarBot, LocalHttpServer
+
+# Each synthetic user goes through the same session; replies counts the
+# sendMessage/editMessageText calls the bot makes for it
+SESSION = [
+    ('message', '/start'),
+    ('callback', 'add_reminder'),
+    ('message', 'Harness reminder, 2030-01-01'),
+    ('callback', 'list_reminders'),
+]
+REPLIES_PER_SESSION = 4
+
+class FakeBotApi:
+    # Answers every Bot API method the handlers use, after an optional delay
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.replies = 0
+        self.message_id = 0
+
+    async def handle(self, request):
+        method = request.path.rsplit('/', 1)[-1]
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = self._params(request)
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Harness', 'username': 'harness_bot'}
+        elif method in ('sendMessage', 'editMessageText'):
+            self.replies += 1
+            self.message_id += 1
+            result = {
+                'message_id': self.message_id,
+                'date': int(time()),
+                'chat': {'id': int(params.get('chat_id', 1)), 'type': 'private'},
+                'text': params.get('text', '')
+            }
+        else:
+            result = True
+        return 200, 'application/json', json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+    def _params(self, request):
+        content_type = request.headers.get('content-type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(request.body or b'{}')
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            return {k: v[0] for k, v in parse_qs(request.body.decode('utf-8')).items()}
+        return {}
+
+def make_update(update_id, user_id, kind, payload):
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+    chat = {'id': user_id, 'type': 'private'}
+    if kind == 'message':
+        message = {'message_id': update_id, 'date': int(time()), 'chat': chat, 'from': user, 'text': payload}
+        if payload.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(payload)}]
+        return {'update_id': update_id, 'message': message}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(user_id),
+            'data': payload,
+            'message': {'message_id': update_id, 'date': int(time()), 'chat': chat, 'text': 'menu'}
+        }
+    }
+
+async def post_updates(port, path, secret, updates):
+    # One keep-alive connection, like each of Telegram's webhook connections
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        for update in updates:
+            body = json.dumps(update).encode('utf-8')
+            head = (
+                f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                + (f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n" if secret else '')
+                + "\r\n"
+            )
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+
+            status = (await reader.readline()).split()[1]
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            if status != b'200':
+                raise RuntimeError(f"Webhook answered {status.decode()}")
+    finally:
+        writer.close()
+
+async def main(args):
+    api = FakeBotApi(args.api_latency)
+    api_server = LocalHttpServer({}, port=0, fallback=api.handle)
+    await api_server.start()
+
+    os.environ.update({
+        'BOT_TOKEN': '123456:HARNESS',
+        'BOT_MODE': 'webhook',
+        'WEBHOOK_LISTEN': '127.0.0.1',
+        'WEBHOOK_PORT': '0',
+        'WEBHOOK_SECRET': 'harness',
+        'CONCURRENT_UPDATES': str(args.concurrent_updates),
+        'REMINDER_STORE': 'memory',
+        'TELEGRAM_API_BASE_URL': f'http://127.0.0.1:{api_server.port}/bot',
+    })
+    os.environ.pop('WEBHOOK_URL', None)
+
+    bot = CalendarBot()
+    run_task = asyncio.create_task(bot.run())
+    while not (bot.webhook_server and bot.webhook_server.port):
+        if run_task.done():
+            run_task.result()
+        await asyncio.sleep(0.01)
+
+    # Users are spread over the connections; each user's updates stay on one
+    # connection, so they reach the bot in order
+    connections = [[] for _ in range(args.connections)]
+    update_id = 0
+    for user_id in range(1, args.users + 1):
+        for kind, payload in SESSION:
+            update_id += 1
+            connections[user_id % args.connections].append(make_update(update_id, user_id, kind, payload))
+
+    expected = args.users * REPLIES_PER_SESSION
+    started = monotonic()
+    await asyncio.gather(*(
+        post_updates(bot.webhook_server.port, bot.webhook_path, bot.webhook_secret, updates)
+        for updates in connections if updates
+    ))
+    posted = monotonic() - started
+    while api.replies < expected and monotonic() - started < args.timeout:
+        await asyncio.sleep(0.01)
+    elapsed = monotonic() - started
+
+    run_task.cancel()
+    await asyncio.gather(run_task, return_exceptions=True)
+    await api_server.stop()
+
+    print(json.dumps({
+        'users': args.users,
+        'updates': update_id,
+        'concurrent_updates': args.concurrent_updates,
+        'connections': args.connections,
+        'api_latency': args.api_latency,
+        'post_seconds': round(posted, 3),
+        'total_seconds': round(elapsed, 3),
+        'updates_per_second': round(update_id / elapsed, 1),
+        'replies': api.replies,
+        'expected_replies': expected,
+        'completed': api.replies >= expected,
+        'api_calls': dict(api.calls),
+    }, indent=2))
+    return 0 if api.replies >= expected else 1
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Post synthetic updates to the bot's webhook and measure throughput")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--connections', type=int, default=40, help="parallel webhook connections")
+    parser.add_argument('--concurrent-updates', type=int, default=64)
+    parser.add_argument('--api-latency', type=float, default=0.0, help="seconds the fake Bot API waits per call")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    sys.exit(asyncio.run(main(args)))